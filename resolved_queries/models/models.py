@@ -5,10 +5,121 @@ import os.path as path
 import re
 import subprocess
 import base64
+import hashlib
+import shutil
+import tempfile
+from contextlib import ExitStack
 
 from odoo import models, fields, api,tools,_
 from odoo.exceptions import UserError
 
+#~ Tamaño de los bloques en que se lee el log y se copian los resultados
+LOG_BLOCK_SIZE = 1024 * 1024
+
+#~ Tamaño máximo del archivo de resultados cuando los adjuntos se guardan en la base de datos
+QUERY_FILE_DB_LIMIT = 16 * 1024 * 1024
+TRUNCATED_NOTE = b'\n... truncated: only the first %d bytes are kept in the database\n'
+
+
+def scan_log(logfile, scans):
+    """ Read ``logfile`` in blocks of LOG_BLOCK_SIZE bytes, so that memory
+        use does not depend on its size, and write the lines matching each
+        regular expression to its file as they are found.
+
+    :param scans: list of ``(compiled regular expression, binary file)``
+    :return: list of the number of lines matching each expression
+    """
+    counts = [0] * len(scans)
+    number = 0
+    rest = b''
+    with open(logfile, 'rb') as f:
+        for block in iter(lambda: f.read(LOG_BLOCK_SIZE), b''):
+            lines = (rest + block).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                number += 1
+                _match_line(line + b'\n', number, scans, counts)
+        if rest:
+            _match_line(rest, number + 1, scans, counts)
+    return counts
+
+
+def _match_line(line, number, scans, counts):
+    if line.endswith(b'\r\n'):
+        line = line[:-2] + b'\n'
+    text = line.decode('utf-8', 'replace')
+    for index, (patron, output) in enumerate(scans):
+        if patron.search(text):
+            counts[index] += 1
+            output.write(('N-%s:L-%s:%s' % (counts[index], number, text)).encode('utf-8'))
+
+
+def store_query_file(record, temp, filename):
+    """ Store the content of the binary file ``temp`` in the ``query_file``
+        field of ``record``.  When attachments are kept in the filestore, the
+        file is copied there in blocks and the attachment created on it, so
+        memory use does not depend on the number of matches; in the database
+        only the first QUERY_FILE_DB_LIMIT bytes are kept.
+    """
+    Attachment = record.env['ir.attachment'].sudo()
+    record.store_fname = filename
+    if Attachment._storage() != 'file':
+        temp.seek(0)
+        content = temp.read(QUERY_FILE_DB_LIMIT)
+        if temp.read(1):
+            content += TRUNCATED_NOTE % QUERY_FILE_DB_LIMIT
+        record.query_file = base64.b64encode(content)
+        return
+    fname, size, checksum = _filestore_write(Attachment, temp)
+    #~ elimina el adjunto anterior
+    record.query_file = False
+    attachment = Attachment.create({
+        'name': 'query_file',
+        'datas_fname': filename,
+        'res_model': record._name,
+        'res_field': 'query_file',
+        'res_id': record.id,
+        'type': 'binary',
+        'mimetype': 'text/plain',
+        'store_fname': fname,
+    })
+    #~ create() descarta file_size y checksum, que calcula a partir de datas
+    record.env.cr.execute(
+        "UPDATE ir_attachment SET file_size=%s, checksum=%s WHERE id=%s",
+        (size, checksum, attachment.id))
+    attachment.invalidate_cache(['file_size', 'checksum'])
+    record.invalidate_cache(['query_file'])
+
+
+def _filestore_write(Attachment, temp):
+    """ Copy the binary file ``temp`` in the filestore like
+        ``ir.attachment._file_write`` does, in blocks; the file appears
+        under its final name once complete.
+
+    :return: ``(store_fname, size, checksum)``
+    """
+    sha = hashlib.sha1()
+    size = 0
+    temp.seek(0)
+    for block in iter(lambda: temp.read(LOG_BLOCK_SIZE), b''):
+        sha.update(block)
+        size += len(block)
+    checksum = sha.hexdigest()
+    fname, full_path = Attachment._get_path(None, checksum)
+    if not path.exists(full_path):
+        fd, partial_path = tempfile.mkstemp(dir=path.dirname(full_path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                temp.seek(0)
+                shutil.copyfileobj(temp, f, LOG_BLOCK_SIZE)
+            os.rename(partial_path, full_path)
+        except Exception:
+            os.unlink(partial_path)
+            raise
+        #~ se borra si la transacción no se confirma
+        Attachment._mark_for_gc(fname)
+    return fname, size, checksum
+
 class resolvedQueries(models.Model):
     _name = 'resolved.queries'
     _rec_name='model_id'
@@ -114,23 +225,13 @@ class resolvedQueries(models.Model):
             self.total_row=model.search_count([])
             to_date=fields.Date.today()
             patron=re.compile(self.search_parameter)
-            linesFound=''
-            total=0
-            cant=0
-            with open(logfile, "r") as f:
-                lines = f.readlines()
-                for line in lines:
-                    total+=1
-                    match = patron.search(line)
-                    if match:
-                        cant+=1
-                        linesFound+='N-%s:L-%s:%s' %(str(cant),str(total),line)
-            if linesFound:
-                self.query_file = base64.b64encode(bytes(linesFound, 'utf-8'))
-                self.store_fname="%s_%s_t_%s.txt" %(self.model_id.name,to_date,str(cant))
-            else:
-                self.query_file = ''
-                self.store_fname=''
+            with tempfile.TemporaryFile() as linesFound:
+                cant=scan_log(logfile, [(patron, linesFound)])[0]
+                if cant:
+                    store_query_file(self, linesFound, "%s_%s_t_%s.txt" %(self.model_id.name,to_date,str(cant)))
+                else:
+                    self.query_file = ''
+                    self.store_fname=''
             self.total=cant
 
 class ResolvedQueriesWizard(models.TransientModel):
@@ -178,39 +279,33 @@ class ResolvedQueriesWizard(models.TransientModel):
             msg=_('The %s file does not have read permission.' % logfile)
             raise UserError(_(msg))
         selfTotal=0
-        selfLinesFound=''
         to_date=fields.Date.today()
         nameFile=''
-        for record in self.resolved_queries_ids:
-            if record.search_parameter:
-                nameFile+=record.model_id.name[0]
+        records=self.resolved_queries_ids.filtered('search_parameter')
+        with ExitStack() as stack:
+            #~ un solo recorrido del log para todas las consultas
+            scans=[]
+            for record in records:
                 model=self.env[record.model_id.model]
                 self.total_row=model.search_count([])
-                patron=re.compile(record.search_parameter)
-                linesFound=''
-                total=0
-                cant=0
-                with open(logfile, "r") as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        total+=1
-                        match = patron.search(line)
-                        if match:
-                            cant+=1
-                            linesFound+='N-%s:L-%s:%s' %(str(cant),str(total),line)
-                if linesFound:
-                    selfLinesFound+=linesFound
-                    record.query_file = base64.b64encode(bytes(linesFound, 'utf-8'))
-                    record.store_fname="%s_%s_t_%s.txt" %(nameFile,to_date,str(cant))
+                scans.append((re.compile(record.search_parameter), stack.enter_context(tempfile.TemporaryFile())))
+            counts=scan_log(logfile, scans) if scans else []
+            selfLinesFound=stack.enter_context(tempfile.TemporaryFile())
+            for record, (patron, linesFound), cant in zip(records, scans, counts):
+                nameFile+=record.model_id.name[0]
+                if cant:
+                    linesFound.seek(0)
+                    shutil.copyfileobj(linesFound, selfLinesFound, LOG_BLOCK_SIZE)
+                    store_query_file(record, linesFound, "%s_%s_t_%s.txt" %(nameFile,to_date,str(cant)))
                 else:
                     record.query_file = ''
                     record.store_fname=''
                 record.total=cant
                 selfTotal+=cant
-        if selfLinesFound:
-            self.total=selfTotal
-            self.query_file = base64.b64encode(bytes(selfLinesFound, 'utf-8'))
-            self.store_fname="%s_%s_t_%s.txt" %(record.model_id.name,to_date,str(selfTotal))
+            if selfTotal:
+                self.total=selfTotal
+                store_query_file(self, selfLinesFound, "%s_%s_t_%s.txt" %(
+                    self.resolved_queries_ids[-1].model_id.name,to_date,str(selfTotal)))
         return {
         'context': self.env.context,
         'view_type': 'form',
@@ -17,7 +17,9 @@
     'version': '0.1',
     'depends': ['base'],
     'data': [
-        'security/ir.model.access.csv'
+        'security/ir.model.access.csv',
+        'views/view_record_cache_stats.xml',
+        'views/view_record_cache_warmup.xml',
     ],
     'demo': [],
     'images': ['static/images/view_cache_screenshot.png'],
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http, _
+from odoo.exceptions import AccessError
+from odoo.http import request
+
+from ..models.cache_signaling import flush_partition
+
+
+class ViewRecordCacheController(http.Controller):
+
+    @http.route('/view_record_cache/stats', type='json', auth='user')
+    def stats(self):
+        """ Counters of the view caches summed over the live workers. """
+        if not request.env.user.has_group('base.group_system'):
+            raise AccessError(_("Only administrators can read the view cache statistics."))
+        return request.env['view.record.cache.stats'].sudo().get_aggregated_stats()
+
+    @http.route('/view_record_cache/flush', type='json', auth='user')
+    def flush(self, partition, model=None):
+        """ Drop the cached entries of ``partition`` (``backend`` or
+            ``website_<id>``) of ``model``, or of every cached model.
+        """
+        if not request.env.user.has_group('base.group_system'):
+            raise AccessError(_("Only administrators can flush the view caches."))
+        flush_partition(request.env.cr.dbname, partition, [model] if model else None)
+        return True
@@ -1,3 +1,8 @@
+from . import record_cache_mixin
 from . import ir_ui_view
+from . import ir_module
+from . import ir_translation
+from . import cache_stats
+from . import cache_warmup
 #~ import ir_ui_view
 #~ import model
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Canonical cache keys.
+
+Keys are plain tuples of hashable values, so building one costs a few tuple
+allocations instead of a ``str()`` of every argument followed by a SHA-1, and
+requests that only differ in spelling share an entry: operator aliases,
+``limit=None``/``limit=0``, the order of the leaves of a pure conjunction or
+of the values of an ``in`` leaf.  Keys only hold primitives, so their
+``repr()`` is stable across processes (see :func:`.shared_store.encode_key`).
+"""
+
+import hashlib
+import weakref
+
+from odoo.osv import expression
+
+OPERATOR_ALIASES = {'<>': '!=', '==': '='}
+SET_OPERATORS = ('in', 'not in')
+
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+# Values tagged with their type in keys: False and None mean NULL in a
+# domain, and must not be equal to 0 (nor True to 1) once hashed.
+_TAGGED_TYPES = (bool, type(None))
+_TAGS = frozenset(cls.__name__ for cls in _TAGGED_TYPES)
+
+
+def freeze(value):
+    """ Hashable equivalent of a domain value; booleans and ``None`` are
+        tagged with their type, see :func:`thaw`.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return _sorted(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, _TAGGED_TYPES):
+        return (type(value).__name__, value)
+    return value
+
+
+def thaw(value):
+    """ Value equivalent to the frozen ``value``, sequences as lists. """
+    if isinstance(value, tuple):
+        if len(value) == 2 and value[0] in _TAGS and isinstance(value[1], _TAGGED_TYPES):
+            return value[1]
+        return [thaw(item) for item in value]
+    return value
+
+
+def thaw_domain(domain):
+    """ Domain equivalent to the normalized ``domain``, to search it again. """
+    return [
+        term if isinstance(term, str) else tuple(thaw(item) for item in term)
+        for term in domain
+    ]
+
+
+def _sorted(values):
+    # values are frozen: False and 0 are distinct
+    values = tuple(set(values))
+    try:
+        return tuple(sorted(values))
+    except TypeError:
+        return tuple(sorted(values, key=repr))
+
+
+def normalize_leaf(leaf):
+    if not isinstance(leaf, (list, tuple)) or len(leaf) != 3 or not isinstance(leaf[1], str):
+        return freeze(leaf)
+    left, operator, right = leaf
+    operator = operator.lower()
+    operator = OPERATOR_ALIASES.get(operator, operator)
+    if operator in SET_OPERATORS and isinstance(right, (list, tuple, set, frozenset)):
+        right = _sorted(freeze(item) for item in right)
+    else:
+        right = freeze(right)
+    return (left, operator, right)
+
+
+def normalize_domain(domain):
+    """ Return ``domain`` as a canonical tuple.
+
+    Leaves are normalized one by one; when the domain is a pure conjunction
+    (no ``'|'`` nor ``'!'``) the ``'&'`` operators are dropped and the leaves
+    sorted, since their order cannot change the result set.
+    """
+    if not domain:
+        return ()
+    terms = [
+        term if expression.is_operator(term) else normalize_leaf(term)
+        for term in domain
+    ]
+    if expression.OR_OPERATOR in terms or expression.NOT_OPERATOR in terms:
+        return tuple(terms)
+    return tuple(sorted((term for term in terms if term != expression.AND_OPERATOR), key=repr))
+
+
+def normalize_order(order):
+    """ Canonical spelling of an ``ORDER BY`` specification. """
+    if not order:
+        return None
+    terms = []
+    for term in order.split(','):
+        words = term.split()
+        if not words:
+            continue
+        if words[-1].lower() == 'asc':
+            words = words[:-1]
+        elif words[-1].lower() == 'desc':
+            words[-1] = 'desc'
+        terms.append(' '.join(words))
+    return ','.join(terms) or None
+
+
+def normalize_fields(fields):
+    """ Canonical tuple of field names, ``None`` meaning all fields. """
+    if not fields:
+        return None
+    return tuple(sorted(set(fields)))
+
+
+def group_fingerprint(env):
+    """ Short digest of the groups of the user of ``env``, computed once per
+        environment.
+    """
+    fingerprint = _fingerprints.get(env)
+    if fingerprint is None:
+        ids = sorted(env.user.groups_id.ids)
+        fingerprint = hashlib.sha1(','.join(map(str, ids)).encode('ascii')).hexdigest()[:16]
+        _fingerprints[env] = fingerprint
+    return fingerprint
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Shedding of cache entries under memory pressure.
+
+Workers are recycled once their memory exceeds ``limit_memory_soft``, which
+throws their caches away.  Every few seconds, a worker storing entries
+measures its memory like the server does and, past
+``view_record_cache_memory_threshold`` percent of the limit, drops the least
+recently used entries of every cache, ``view_record_cache_memory_shed``
+percent of its bytes.  The allocator keeps freed memory for new objects
+rather than returning it to the system, so the caches are only shed again if
+the process keeps growing.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+from odoo import tools
+from odoo.service.server import memory_info
+
+_logger = logging.getLogger(__name__)
+
+# percentage of limit_memory_soft past which entries are dropped
+DEFAULT_THRESHOLD = 90
+
+# percentage of the bytes of every cache dropped at once
+DEFAULT_SHED = 25
+
+# seconds between two measures of the memory of the process
+CHECK_INTERVAL = 5
+
+_sources = []
+_lock = threading.Lock()
+_state = {
+    'checked': 0.0,         # time.monotonic() of the last measure
+    'shed_at': None,        # memory of the process when entries were last dropped
+}
+
+
+def register_memory_source(func):
+    """ Register ``func()``, returning an iterable of the caches of this
+        process that may be shed.
+    """
+    _sources.append(func)
+
+
+def _option(name, default):
+    try:
+        return int(tools.config.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def maybe_shed_caches():
+    """ Drop entries if the memory of the process nears ``limit_memory_soft``;
+        measured at most every :data:`CHECK_INTERVAL` seconds.
+    """
+    now = time.monotonic()
+    if now - _state['checked'] < CHECK_INTERVAL:
+        return
+    # set first so that concurrent requests do not measure twice
+    _state['checked'] = now
+    limit = _option('limit_memory_soft', 0)
+    threshold = _option('view_record_cache_memory_threshold', DEFAULT_THRESHOLD)
+    if not limit or not threshold:
+        return
+    try:
+        used = memory_info(psutil.Process(os.getpid()))
+    except Exception:
+        _logger.debug("Could not measure the memory of the process", exc_info=True)
+        return
+    shed_caches(used, limit * threshold // 100)
+
+
+def shed_caches(used, high_water):
+    """ Drop the coldest entries of every cache when ``used`` bytes exceed
+        ``high_water`` and grew since entries were last dropped; return the
+        number of bytes freed.
+    """
+    with _lock:
+        if used < high_water:
+            _state['shed_at'] = None
+            return 0
+        if _state['shed_at'] is not None and used <= _state['shed_at']:
+            return 0
+        _state['shed_at'] = used
+    fraction = min(max(_option('view_record_cache_memory_shed', DEFAULT_SHED), 0), 100) / 100.0
+    freed = 0
+    for func in _sources:
+        for cache in func():
+            freed += cache.shed(fraction)
+    _logger.info("Process memory %d bytes over %d: dropped %d bytes of cached entries",
+                 used, high_water, freed)
+    return freed
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Background refresh of stale cache entries.
+
+Once an entry outlives the time-to-live of its cache, requests keep getting
+it while the call that computed it is replayed once, in a worker thread of
+this process, with ``record_cache_refresh`` in the context so that it skips
+the caches and stores a fresh value.  A failed refresh drops the entry, so
+the next request recomputes it.
+"""
+
+import logging
+import queue
+import threading
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+from .cache_warmup import replay_call
+
+_logger = logging.getLogger(__name__)
+
+# refreshes waiting in this process beyond which stale entries are served
+# without scheduling another one
+MAX_PENDING = 1000
+
+_queue = queue.Queue()
+_pending = set()            # (dbname, model, method, key)
+_pending_lock = threading.Lock()
+_thread = None
+
+
+def schedule_refresh(dbname, model, method, key, arguments, meta, discard, context=None):
+    """ Recompute the entry ``key`` in the background, unless a refresh of it
+        is already pending.
+
+    :param arguments: positional arguments of the call computing the entry
+    :param meta: ``(uid, lang, website_id)`` of the call
+    :param discard: callable dropping the entry when the refresh fails
+    :param context: context values the entry depends on
+    :return: whether a refresh was scheduled
+    """
+    global _thread
+    item = (dbname, model, method, key)
+    with _pending_lock:
+        if item in _pending or len(_pending) >= MAX_PENDING:
+            return False
+        _pending.add(item)
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_refresh_loop, name='view_record_cache.refresh')
+            _thread.daemon = True
+            _thread.start()
+    _queue.put((item, arguments, meta, discard, dict(context or {}, record_cache_refresh=True)))
+    return True
+
+
+def _refresh_loop():
+    while True:
+        item, arguments, meta, discard, context = _queue.get()
+        dbname, model, method, _key = item
+        try:
+            with api.Environment.manage():
+                with odoo.registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    replay_call(env, model, method, arguments, *meta, context=context)
+        except Exception:
+            _logger.warning("Could not refresh a stale %s %s entry, dropping it",
+                            model, method, exc_info=True)
+            discard()
+        finally:
+            with _pending_lock:
+                _pending.discard(item)
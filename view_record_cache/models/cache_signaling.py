@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""Cross-worker invalidation of the view caches.
+
+Like the registry signaling sequences of Odoo, every cached model has a
+version stamp stored in the database.  A process that changes cached records
+bumps the stamp of the model *after* its transaction commits and logs the ids
+it touched, with the values of their columns before and after the change
+when it knows them; every other worker reads the (tiny) stamp table once per
+transaction and drops only the entries affected by the logged changes.
+
+The bump is a single autocommit statement that locks the stamp row before
+drawing the new value, so stamps of a model are committed in increasing
+order and each log row carries the stamp it replaced.  A reader can therefore
+check that the rows it fetched form an unbroken chain; when they do not
+(rows pruned, worker idle for too long) it falls back to a full flush.
+
+A flush of one cache partition bumps a stamp of its own (see
+:func:`partition_stamp_key`); entries of the shared tiers are tagged with
+the latest of the stamps of their model and partition, so the flush leaves
+the entries of the other partitions reachable.
+"""
+
+import json
+import logging
+import threading
+import weakref
+from contextlib import closing
+
+from odoo.sql_db import db_connect
+
+_logger = logging.getLogger(__name__)
+
+SIGNALING_TABLE = 'view_record_cache_signaling'
+SIGNALING_LOG = 'view_record_cache_signaling_log'
+SIGNALING_SEQUENCE = 'view_record_cache_signaling_seq'
+
+# log rows older than this are pruned when a new change is signaled
+LOG_RETENTION = '1 day'
+
+# changes of more rows than this are logged without their values
+MAX_LOGGED_ROWS = 1000
+
+# separates the model from the partition in the stamps of partitions
+PARTITION_SEPARATOR = '@'
+
+
+def setup_signaling(cr):
+    """ Create the stamp table, its sequence and the change log. """
+    cr.execute("CREATE SEQUENCE IF NOT EXISTS %s INCREMENT BY 1 START WITH 1" % SIGNALING_SEQUENCE)
+    cr.execute("""
+        CREATE TABLE IF NOT EXISTS %s (
+            model varchar PRIMARY KEY,
+            stamp bigint NOT NULL
+        )""" % SIGNALING_TABLE)
+    cr.execute("""
+        CREATE TABLE IF NOT EXISTS %s (
+            stamp bigint PRIMARY KEY,
+            prev_stamp bigint NOT NULL,
+            model varchar NOT NULL,
+            res_ids integer[],
+            res_rows jsonb,
+            create_date timestamp NOT NULL DEFAULT (now() at time zone 'UTC')
+        )""" % SIGNALING_LOG)
+    cr.execute("ALTER TABLE %s ADD COLUMN IF NOT EXISTS res_rows jsonb" % SIGNALING_LOG)
+
+
+def signaling_ready(cr):
+    """ Whether :func:`setup_signaling` ran on the database of ``cr``. """
+    cr.execute("SELECT to_regclass(%s) IS NOT NULL", (SIGNALING_LOG,))
+    return cr.fetchone()[0]
+
+
+def partition_stamp_key(model, partition):
+    """ Name of the stamp bumped when ``partition`` of ``model`` is flushed. """
+    return '%s%s%s' % (model, PARTITION_SEPARATOR, partition)
+
+
+def split_stamp_key(key):
+    """ Return ``(model, partition)`` of a stamp name, ``partition`` being
+        ``None`` for the stamp of a model.
+    """
+    model, _separator, partition = key.partition(PARTITION_SEPARATOR)
+    return model, partition or None
+
+
+def entry_stamp(stamps, model, partition=None):
+    """ Stamp tagging the shared entries of ``partition`` of ``model``: the
+        stamps come from one sequence, so the latest of the model and
+        partition stamps changes whenever either is bumped.
+    """
+    stamp = stamps.get(model, 0)
+    if partition:
+        stamp = max(stamp, stamps.get(partition_stamp_key(model, partition), 0))
+    return stamp
+
+
+def signal_changes(dbname, model, ids=None, rows=None):
+    """ Bump the stamp of ``model`` and log the changed ``ids``; ``None``
+        means every cached entry of the model is stale.  ``rows`` are the
+        column values of the records before and after the changes, ``None``
+        when they are unknown.  ``model`` may also be the stamp of a
+        partition (see :func:`partition_stamp_key`).
+
+        Runs in its own autocommit connection: it is meant to be called once
+        the transaction that made the changes has committed.
+    """
+    with closing(db_connect(dbname).cursor()) as cr:
+        cr.autocommit(True)
+        if ids is None or rows is None or len(rows) > MAX_LOGGED_ROWS:
+            rows = None
+        cr.execute("""
+            INSERT INTO {table} (model, stamp) VALUES (%s, 0)
+            ON CONFLICT (model) DO NOTHING
+        """.format(table=SIGNALING_TABLE), (model,))
+        cr.execute("""
+            WITH prev AS (
+                SELECT stamp FROM {table} WHERE model = %(model)s FOR UPDATE
+            ), bump AS (
+                UPDATE {table} s SET stamp = nextval('{sequence}')
+                FROM prev WHERE s.model = %(model)s
+                RETURNING s.stamp, prev.stamp AS prev_stamp
+            )
+            INSERT INTO {log} (stamp, prev_stamp, model, res_ids, res_rows)
+            SELECT stamp, prev_stamp, %(model)s, %(ids)s::integer[], %(rows)s::jsonb
+            FROM bump
+        """.format(table=SIGNALING_TABLE, log=SIGNALING_LOG, sequence=SIGNALING_SEQUENCE),
+            {'model': model, 'ids': None if ids is None else sorted(ids),
+             'rows': None if rows is None else json.dumps(rows)})
+        cr.execute("DELETE FROM {log} WHERE create_date < (now() at time zone 'UTC') - interval %s"
+                   .format(log=SIGNALING_LOG), (LOG_RETENTION,))
+
+
+def read_stamps(cr):
+    """ Return the current ``{model: stamp}`` mapping. """
+    cr.execute("SELECT model, stamp FROM %s" % SIGNALING_TABLE)
+    return dict(cr.fetchall())
+
+
+def read_changes(cr, model, seen, stamp):
+    """ Return ``(ids, rows)`` for the records of ``model`` changed between
+        stamps ``seen`` and ``stamp``: ``ids`` is ``None`` when the whole
+        model must be flushed, ``rows`` when some changes were logged without
+        their values.
+    """
+    cr.execute("""
+        SELECT stamp, prev_stamp, res_ids, res_rows FROM {log}
+        WHERE model = %s AND stamp > %s AND stamp <= %s
+        ORDER BY stamp
+    """.format(log=SIGNALING_LOG), (model, seen, stamp))
+    ids = set()
+    rows = []
+    previous = seen
+    for row_stamp, prev_stamp, res_ids, res_rows in cr.fetchall():
+        if prev_stamp != previous:
+            return None, None
+        previous = row_stamp
+        if res_ids is None:
+            return None, None
+        ids.update(res_ids)
+        if res_rows is None or rows is None:
+            rows = None
+        else:
+            rows.extend(res_rows)
+    if previous != stamp:
+        return None, None
+    return ids, rows
+
+
+#
+# Process-local bookkeeping
+#
+
+_invalidators = {}                          # model: func(dbname, ids, rows, partition)
+_reset_listeners = []                       # func(dbname, model)
+_seen_stamps = {}                           # dbname: {model: stamp}
+_generations = {}                           # dbname: int
+_ready = set()                              # dbnames with signaling tables
+_transactions = weakref.WeakKeyDictionary() # cursor: CacheTransaction
+_lock = threading.RLock()
+
+
+def register_invalidator(model, func):
+    """ Register ``func(dbname, ids, rows, partition)`` to drop the cached
+        entries of ``model`` affected by changes to ``ids`` (``None`` meaning
+        all of them), whose column values before and after the changes are
+        ``rows`` (``None`` when unknown), in ``partition`` only when it is
+        set.
+    """
+    _invalidators[model] = func
+
+
+def register_reset_listener(func):
+    """ Register ``func(dbname, model)``, called when another worker
+        signaled that every entry of ``model`` is outdated, e.g. after a
+        module upgrade.
+    """
+    _reset_listeners.append(func)
+
+
+def invalidate(dbname, model, ids=None, rows=None, partition=None):
+    """ Drop the local entries of ``model`` affected by ``ids``, in
+        ``partition`` only when it is set.
+    """
+    func = _invalidators.get(model)
+    with _lock:
+        if func is not None:
+            func(dbname, ids, rows, partition)
+        _generations[dbname] = _generations.get(dbname, 0) + 1
+
+
+class CacheTransaction(object):
+    """ Cache state of one database transaction.
+
+    ``generation`` is the local cache generation entries computed in this
+    transaction may be stored under, or ``None`` when the transaction must
+    neither read nor fill the caches: it changed cached records itself, or
+    its snapshot is older than changes already applied locally.
+    ``stamps`` are the model stamps visible to the transaction; shared
+    stores tag their entries with them.  ``changes`` maps models to the ids
+    changed by the transaction, and ``rows`` to their column values before
+    and after the changes (``None`` when unknown); they are signaled to the
+    other workers once it commits.
+    """
+    __slots__ = ('dbname', 'generation', 'stamps', 'changes', 'rows')
+
+    def __init__(self, dbname, generation, stamps):
+        self.dbname = dbname
+        self.generation = generation
+        self.stamps = stamps
+        self.changes = {}
+        self.rows = {}
+
+    def stamp(self, model, partition=None):
+        return entry_stamp(self.stamps, model, partition)
+
+    def can_read(self):
+        return self.generation is not None
+
+    def can_store(self):
+        return self.generation is not None and \
+            self.generation == _generations.get(self.dbname, 0)
+
+
+def get_transaction(cr):
+    """ Return the :class:`CacheTransaction` of the current transaction of
+        ``cr``, checking the stamps of the database the first time.
+    """
+    transaction = _transactions.get(cr)
+    if transaction is None:
+        generation, stamps = _check_stamps(cr)
+        transaction = _transactions[cr] = CacheTransaction(cr.dbname, generation, stamps)
+        cr_ref = weakref.ref(cr)
+        cr.after('commit', lambda: _end_transaction(cr_ref, transaction, True))
+        cr.after('rollback', lambda: _end_transaction(cr_ref, transaction, False))
+    return transaction
+
+
+def record_changes(cr, model, ids=None, rows=None):
+    """ Invalidate the local entries of ``model`` for ``ids`` and remember
+        them for signaling when the transaction of ``cr`` commits.
+
+    :param rows: column values of the records of ``ids``, before or after
+        the change, or ``None`` when unknown
+    """
+    transaction = get_transaction(cr)
+    transaction.generation = None
+    changes = transaction.changes
+    if ids is None or changes.get(model, ()) is None:
+        changes[model] = None
+    else:
+        changes.setdefault(model, set()).update(ids)
+    if rows is None or transaction.rows.get(model, ()) is None:
+        transaction.rows[model] = None
+    else:
+        transaction.rows.setdefault(model, []).extend(rows)
+    invalidate(cr.dbname, model, ids, rows)
+
+
+def flush_partition(dbname, partition, models=None):
+    """ Drop every entry of the cache ``partition`` of ``models`` (all
+        cached models by default) in this worker now, and in the others on
+        their next transaction.
+
+        The caches hold no data of their own, so the flush is signaled right
+        away rather than when a transaction commits.  It bumps the stamp of
+        the partition only: the shared entries of the other partitions of
+        the model stay valid.
+    """
+    for model in list(_invalidators) if models is None else models:
+        if model in _invalidators:
+            invalidate(dbname, model, partition=partition)
+            signal_changes(dbname, partition_stamp_key(model, partition))
+
+
+def record_all_changes(cr):
+    """ Invalidate every cached model, e.g. when modules are installed or
+        upgraded.
+    """
+    for model in list(_invalidators):
+        record_changes(cr, model)
+
+
+def collect_with_stamps(dbname, func):
+    """ Return ``(stamps, func())``, ``stamps`` being the model stamps the
+        local entries of ``dbname`` are valid for, or ``None`` when this
+        process did not check them yet; no invalidation runs in between.
+    """
+    with _lock:
+        seen = _seen_stamps.get(dbname)
+        return (None if seen is None else dict(seen)), func()
+
+
+def _end_transaction(cr_ref, transaction, committed):
+    cr = cr_ref()
+    if cr is not None and _transactions.get(cr) is transaction:
+        del _transactions[cr]
+    if committed:
+        for model, ids in transaction.changes.items():
+            try:
+                signal_changes(transaction.dbname, model, ids, transaction.rows.get(model))
+            except Exception:
+                _logger.exception("Could not signal cache changes of %s", model)
+
+
+def _check_stamps(cr):
+    """ Apply the changes signaled by other workers since the last check and
+        return the generation the transaction may store entries under, with
+        the stamps it sees.
+    """
+    dbname = cr.dbname
+    if dbname not in _ready:
+        if not signaling_ready(cr):
+            return None, {}
+        _ready.add(dbname)
+    stamps = read_stamps(cr)
+    with _lock:
+        seen = _seen_stamps.get(dbname)
+        if seen is None:
+            _seen_stamps[dbname] = dict(stamps)
+            return _generations.get(dbname, 0), stamps
+        outdated = False
+        for key, stamp in stamps.items():
+            last = seen.get(key, 0)
+            if stamp < last:
+                outdated = True
+            elif stamp > last:
+                seen[key] = stamp
+                model, partition = split_stamp_key(key)
+                if partition:
+                    invalidate(dbname, model, partition=partition)
+                    continue
+                ids, rows = read_changes(cr, model, last, stamp)
+                invalidate(dbname, model, ids, rows)
+                if ids is None:
+                    for func in _reset_listeners:
+                        func(dbname, model)
+        return (None if outdated else _generations.get(dbname, 0)), stamps
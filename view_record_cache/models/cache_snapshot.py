@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Snapshots of the local caches on disk, for fast restarts.
+
+Workers periodically dump their entries in one file per database: the values one after the other, serialized like in the shared
+store, followed by an index mapping ``(model, method, partition, key
+digest)`` to the position of the value, the stamp of its model and
+partition it was computed under and its creation time, then a summary of the number of entries and
+the model stamps.  A worker starting later maps the file and only loads the
+index; values are decoded when first looked up, and only accepted when their
+stamp matches the one the transaction sees, so a snapshot taken before a
+view change is ignored entry by entry.
+
+Dumps run in the background thread publishing the statistics.  One worker
+at a time dumps a database, and it only replaces a snapshot still valid for
+the current stamps when it holds at least as many entries, so a recycled
+worker with a cold cache does not overwrite the snapshot of a warm one.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+import time
+
+import odoo
+from odoo import tools
+
+from .shared_store import dumps, encode_key, loads
+from .cache_signaling import collect_with_stamps, entry_stamp
+from .cache_stats import register_flush_hook
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'VRCSNAP2'
+DEFAULT_INTERVAL = 300
+
+# trailer: magic, offset and length of the index, length of the summary
+_TRAILER = struct.Struct('<8sQQQ')
+
+_sources = []
+_snapshots = {}             # dbname: Snapshot or None
+_last_dump = {}             # dbname: time.monotonic()
+_lock = threading.Lock()
+
+
+def register_snapshot_source(func):
+    """ Register ``func(dbname)``, returning an iterable of
+        ``(model, method, partition, cache)`` for the caches of ``dbname``
+        to dump.
+    """
+    _sources.append(func)
+
+
+def snapshot_enabled():
+    return tools.str2bool(tools.config.get('view_record_cache_snapshot', True), True)
+
+
+def snapshot_path(dbname):
+    directory = tools.config.get('view_record_cache_snapshot_dir') or \
+        os.path.join(tools.config['data_dir'], 'view_record_cache')
+    return os.path.join(directory, re.sub(r'[^\w.-]', '_', dbname) + '.snapshot')
+
+
+class Snapshot(object):
+    """ Read-only view of a snapshot file. """
+
+    def __init__(self, path, dbname):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, offset, length, _summary = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+            if magic != MAGIC:
+                raise ValueError("not a view cache snapshot")
+            header = pickle.loads(self._map[offset:offset + length])
+            if header['dbname'] != dbname or header['version'] != odoo.release.version:
+                raise ValueError("snapshot of another database or server version")
+        except Exception:
+            self._map.close()
+            raise
+        self._index = header['index']
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, model, method, partition, key, stamp):
+        """ Return ``(created, value)`` of ``key`` if it was dumped under
+            ``stamp``, or ``None``.
+        """
+        entry = self._index.get((model, method, partition, encode_key(key)))
+        if entry is None or entry[3] != stamp:
+            return None
+        offset, length, flags, _stamp, created = entry
+        try:
+            return created, loads(flags, self._map[offset:offset + length])
+        except Exception:
+            _logger.debug("Discarding undecodable entry in %s", self.path, exc_info=True)
+            return None
+
+    def close(self):
+        self._map.close()
+
+
+def read_summary(path):
+    """ Return the summary ``{'entries': count, 'stamps': stamps}`` of the
+        snapshot file at ``path``, or ``None`` when it is missing or not a
+        snapshot of this version.
+    """
+    try:
+        with open(path, 'rb') as file:
+            file.seek(-_TRAILER.size, os.SEEK_END)
+            magic, _offset, _length, length = _TRAILER.unpack(file.read(_TRAILER.size))
+            if magic != MAGIC:
+                return None
+            file.seek(-_TRAILER.size - length, os.SEEK_END)
+            return pickle.loads(file.read(length))
+    except Exception:
+        return None
+
+
+def get_snapshot(dbname):
+    """ Return the :class:`Snapshot` left by a previous run for ``dbname``,
+        mapped on first use, or ``None``.
+    """
+    try:
+        return _snapshots[dbname]
+    except KeyError:
+        pass
+    with _lock:
+        if dbname not in _snapshots:
+            snapshot = None
+            path = snapshot_path(dbname)
+            if snapshot_enabled() and os.path.exists(path):
+                try:
+                    snapshot = Snapshot(path, dbname)
+                    _logger.info("Mapped %d cached entries from %s", len(snapshot), path)
+                except Exception:
+                    _logger.warning("Ignoring the view cache snapshot %s", path, exc_info=True)
+            _snapshots[dbname] = snapshot
+    return _snapshots[dbname]
+
+
+def dump_snapshot(dbname):
+    """ Write the entries of the local caches of ``dbname`` to its snapshot
+        file; return the number of entries written.
+
+    Nothing is written while another worker dumps the same database, nor
+    when the existing snapshot holds more entries valid for the same stamps.
+    """
+    _last_dump[dbname] = time.monotonic()
+
+    def collect():
+        return [
+            (model, method, partition, cache.items())
+            for func in _sources
+            for model, method, partition, cache in func(dbname)
+        ]
+    stamps, caches = collect_with_stamps(dbname, collect)
+    count = sum(len(items) for _model, _method, _partition, items in caches)
+    if stamps is None or not count:
+        return 0
+
+    path = snapshot_path(dbname)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path + '.lock', 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            _logger.debug("Another worker is dumping the view cache snapshot of %s", dbname)
+            return 0
+        summary = read_summary(path)
+        if summary and summary['stamps'] == stamps and summary['entries'] > count:
+            _logger.debug("Keeping the view cache snapshot of %s, holding %d entries instead of %d",
+                          dbname, summary['entries'], count)
+            return 0
+        return _write_snapshot(dbname, path, stamps, caches)
+
+
+def _write_snapshot(dbname, path, stamps, caches):
+    fd, temp_path = tempfile.mkstemp(prefix='.snapshot-', dir=os.path.dirname(path))
+    index = {}
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            offset = 0
+            for model, method, partition, items in caches:
+                stamp = entry_stamp(stamps, model, partition)
+                for key, value, _meta, created in items:
+                    try:
+                        flags, data = dumps(value)
+                    except Exception:
+                        continue
+                    file.write(data)
+                    index[(model, method, partition, encode_key(key))] = \
+                        (offset, len(data), flags, stamp, created)
+                    offset += len(data)
+            header = pickle.dumps({
+                'dbname': dbname,
+                'version': odoo.release.version,
+                'index': index,
+            }, pickle.HIGHEST_PROTOCOL)
+            summary = pickle.dumps({
+                'entries': len(index),
+                'stamps': stamps,
+            }, pickle.HIGHEST_PROTOCOL)
+            file.write(header)
+            file.write(summary)
+            file.write(_TRAILER.pack(MAGIC, offset, len(header), len(summary)))
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+    _logger.info("Dumped %d cached entries to %s", len(index), path)
+    return len(index)
+
+
+def maybe_dump_snapshot(dbname, cr=None):
+    """ Dump the snapshot of ``dbname`` if the interval elapsed. """
+    if not snapshot_enabled():
+        return
+    try:
+        interval = int(tools.config.get('view_record_cache_snapshot_interval', DEFAULT_INTERVAL))
+    except (TypeError, ValueError):
+        interval = DEFAULT_INTERVAL
+    last = _last_dump.get(dbname)
+    if last is None:
+        # do not overwrite the snapshot of the previous run with a cold cache
+        _last_dump[dbname] = time.monotonic()
+        return
+    if interval <= 0 or time.monotonic() - last < interval:
+        return
+    try:
+        dump_snapshot(dbname)
+    except Exception:
+        _logger.warning("Could not dump the view cache snapshot of %s", dbname, exc_info=True)
+
+register_flush_hook(maybe_dump_snapshot)
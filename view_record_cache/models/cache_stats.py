@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import closing
+
+import odoo
+from odoo import models, fields, api, tools
+from odoo.http import request
+from odoo.sql_db import db_connect
+
+_logger = logging.getLogger(__name__)
+
+# seconds between two publications of the counters of a worker
+DEFAULT_INTERVAL = 60
+
+# rows of workers silent for longer than this are not aggregated
+LIVE_WINDOW = '15 minutes'
+
+_sources = []
+_flush_hooks = []
+_databases = set()      # dbnames whose caches this process publishes
+_timer = None           # (pid, thread) publishing the counters
+_timer_lock = threading.Lock()
+
+
+def register_stats_source(func):
+    """ Register ``func(dbname)``, returning an iterable of
+        ``(model, method, partition, cache)`` for the caches of ``dbname``.
+    """
+    _sources.append(func)
+
+
+def register_flush_hook(func):
+    """ Register ``func(dbname, cr)``, called with the autocommit cursor of
+        every publication of the counters.
+    """
+    _flush_hooks.append(func)
+
+
+def _iter_caches(dbname):
+    for func in _sources:
+        for item in func(dbname):
+            yield item
+
+
+def flush_stats(dbname):
+    """ Publish the counters of this worker in ``view_record_cache_stats``. """
+    host = socket.gethostname()
+    pid = os.getpid()
+    rows = []
+    for model, method, partition, cache in _iter_caches(dbname):
+        values = cache.stats.as_dict()
+        rows.append((
+            host, pid, model, method, partition or '',
+            values['hits'], values['misses'], values['shared_hits'], values['stale_hits'],
+            values['coalesced'], values['sets'],
+            values['rejected'], values['evictions'], len(cache), cache.bytes,
+            values['key_time'], values['miss_time'], values['computed'], values['time_saved'],
+        ))
+    if not rows:
+        return
+    with closing(db_connect(dbname).cursor()) as cr:
+        cr.autocommit(True)
+        for row in rows:
+            cr.execute("""
+                INSERT INTO view_record_cache_stats
+                    (host, pid, model, method, partition, hits, misses, shared_hits, stale_hits,
+                     coalesced, sets, rejected, evictions, entries, bytes, key_time, miss_time,
+                     computed, time_saved, create_date, write_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                        now() at time zone 'UTC', now() at time zone 'UTC')
+                ON CONFLICT (host, pid, model, method, partition) DO UPDATE SET
+                    hits = EXCLUDED.hits, misses = EXCLUDED.misses,
+                    shared_hits = EXCLUDED.shared_hits, stale_hits = EXCLUDED.stale_hits,
+                    coalesced = EXCLUDED.coalesced, sets = EXCLUDED.sets,
+                    rejected = EXCLUDED.rejected, evictions = EXCLUDED.evictions,
+                    entries = EXCLUDED.entries, bytes = EXCLUDED.bytes,
+                    key_time = EXCLUDED.key_time, miss_time = EXCLUDED.miss_time,
+                    computed = EXCLUDED.computed, time_saved = EXCLUDED.time_saved,
+                    write_date = EXCLUDED.write_date
+            """, row)
+        # forget the workers that stopped publishing
+        cr.execute("""
+            DELETE FROM view_record_cache_stats
+            WHERE write_date < (now() at time zone 'UTC') - interval '1 day'
+        """)
+        for func in _flush_hooks:
+            try:
+                func(dbname, cr)
+            except Exception:
+                _logger.warning("View cache statistics hook %s failed", func.__name__, exc_info=True)
+
+
+def can_start_threads():
+    """ Whether this process may start background threads: in prefork mode,
+        only workers serving requests do, never the master process, which
+        would fork them while the threads hold locks.
+    """
+    return not odoo.multi_process or bool(request)
+
+
+def watch_stats(dbname):
+    """ Publish the counters of ``dbname`` from the background thread of
+        this worker, started on its first request; lookups do no database
+        work themselves.
+    """
+    if dbname not in _databases:
+        _databases.add(dbname)
+    timer = _timer
+    if (timer is None or timer[0] != os.getpid()) and can_start_threads():
+        _start_timer()
+
+
+def _start_timer():
+    global _timer
+    with _timer_lock:
+        pid = os.getpid()
+        if _timer is not None and _timer[0] == pid:
+            return
+        thread = threading.Thread(target=_flush_loop, name='view_record_cache.stats')
+        thread.daemon = True
+        _timer = (pid, thread)
+        thread.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(_interval())
+        for dbname in list(_databases):
+            try:
+                flush_stats(dbname)
+            except Exception:
+                # the next lookup on this database registers it again
+                _databases.discard(dbname)
+                _logger.warning("Could not publish the view cache statistics of %s",
+                                dbname, exc_info=True)
+
+
+def _interval():
+    try:
+        interval = int(tools.config.get('view_record_cache_stats_interval', DEFAULT_INTERVAL))
+    except (TypeError, ValueError):
+        interval = DEFAULT_INTERVAL
+    return interval if interval > 0 else DEFAULT_INTERVAL
+
+
+class BigInteger(fields.Integer):
+    """ Integer field stored in a ``bigint`` column: the counters of a busy
+        worker outgrow ``int4`` within days.
+    """
+    column_type = ('int8', 'int8')
+
+
+class ViewRecordCacheStats(models.Model):
+    """ Counters of the view caches, one row per worker, model, method and
+        partition.
+    """
+    _name = 'view.record.cache.stats'
+    _description = 'View record cache statistics'
+    _order = 'model, method, partition, host, pid'
+
+    host = fields.Char(string='Host', readonly=True)
+    pid = fields.Integer(string='Worker PID', readonly=True)
+    model = fields.Char(string='Model', readonly=True)
+    method = fields.Char(string='Method', readonly=True)
+    partition = fields.Char(
+                        string='Partition',
+                        readonly=True,
+                        help="""Caches serving website requests or backend calls""")
+    hits = BigInteger(string='Hits', readonly=True)
+    misses = BigInteger(string='Misses', readonly=True)
+    shared_hits = BigInteger(
+                        string='Shared Hits',
+                        readonly=True,
+                        help="""Local misses answered by the store shared by the workers of the host""")
+    stale_hits = BigInteger(
+                        string='Stale Hits',
+                        readonly=True,
+                        help="""Hits on entries older than the time-to-live, served while they are refreshed""")
+    coalesced = BigInteger(
+                        string='Coalesced',
+                        readonly=True,
+                        help="""Misses answered by a concurrent computation of the same entry""")
+    sets = BigInteger(string='Sets', readonly=True)
+    rejected = BigInteger(
+                        string='Rejected',
+                        readonly=True,
+                        help="""Values refused by the admission filter or larger than the byte budget""")
+    evictions = BigInteger(string='Evictions', readonly=True)
+    entries = fields.Integer(string='Entries', readonly=True)
+    bytes = BigInteger(string='Bytes', readonly=True)
+    key_time = fields.Float(
+                        string='Key Time (s)',
+                        readonly=True,
+                        help="""Time spent building cache keys""")
+    miss_time = fields.Float(
+                        string='Miss Time (s)',
+                        readonly=True,
+                        help="""Time spent computing missing values""")
+    computed = BigInteger(string='Computed Values', readonly=True)
+    time_saved = fields.Float(
+                        string='Time Saved (s)',
+                        readonly=True,
+                        help="""Hits multiplied by the average time of a miss""")
+    hit_ratio = fields.Float(
+                        string='Hit Ratio (%)',
+                        compute='_compute_hit_ratio')
+
+    _sql_constraints = [
+        ('worker_method_uniq', 'unique (host, pid, model, method, partition)',
+         'One row per worker, cached method and partition.'),
+    ]
+
+    @api.depends('hits', 'misses', 'shared_hits')
+    def _compute_hit_ratio(self):
+        for record in self:
+            lookups = record.hits + record.misses
+            record.hit_ratio = 100.0 * (record.hits + record.shared_hits) / lookups if lookups else 0.0
+
+    @api.multi
+    def action_flush_partition(self):
+        """ Drop the cached entries of the models and partitions of the
+            selected rows, in every worker.
+        """
+        for model, partition in set(self.mapped(lambda record: (record.model, record.partition))):
+            if model in self.env and partition:
+                self.env[model]._record_cache_flush(partition)
+        return True
+
+    @api.model
+    def flush_worker_stats(self):
+        """ Publish the counters of the current worker now. """
+        flush_stats(self.env.cr.dbname)
+        return True
+
+    @api.model
+    def get_aggregated_stats(self):
+        """ Sum the counters of the live workers per model, method and
+            partition.
+
+        :return: a list of dicts, one per cached model, method and partition
+        """
+        self.flush_worker_stats()
+        self.env.cr.execute("""
+            SELECT model, method, partition, count(*), sum(hits)::bigint, sum(misses)::bigint,
+                   sum(shared_hits)::bigint, sum(stale_hits)::bigint, sum(coalesced)::bigint,
+                   sum(sets)::bigint, sum(rejected)::bigint, sum(evictions)::bigint,
+                   sum(entries), sum(bytes)::bigint,
+                   sum(key_time), sum(miss_time), sum(computed)::bigint, sum(time_saved)
+            FROM view_record_cache_stats
+            WHERE write_date > (now() at time zone 'UTC') - interval %s
+            GROUP BY model, method, partition
+            ORDER BY model, method, partition
+        """, (LIVE_WINDOW,))
+        result = []
+        for row in self.env.cr.fetchall():
+            (model, method, partition, workers, hits, misses, shared_hits, stale_hits, coalesced, sets, rejected,
+             evictions, entries, size, key_time, miss_time, computed, time_saved) = row
+            lookups = hits + misses
+            result.append({
+                'model': model,
+                'method': method,
+                'partition': partition,
+                'workers': workers,
+                'hits': hits,
+                'misses': misses,
+                'shared_hits': shared_hits,
+                'stale_hits': stale_hits,
+                'coalesced': coalesced,
+                'hit_ratio': 100.0 * (hits + shared_hits) / lookups if lookups else 0.0,
+                'sets': sets,
+                'rejected': rejected,
+                'evictions': evictions,
+                'entries': entries,
+                'bytes': size,
+                'key_time': key_time,
+                'avg_key_time': key_time / lookups if lookups else 0.0,
+                'miss_time': miss_time,
+                'avg_miss_time': miss_time / computed if computed else 0.0,
+                'time_saved': time_saved,
+            })
+        return result
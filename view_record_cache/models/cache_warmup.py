@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import ast
+import logging
+import os
+import random
+import threading
+import time
+
+import odoo
+from odoo import models, fields, api, tools, SUPERUSER_ID
+
+from .cache_stats import can_start_threads, register_flush_hook
+from .cache_signaling import register_reset_listener
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 200
+DEFAULT_DELAY = 5
+# seconds over which the replays of the workers are spread
+DEFAULT_SPREAD = 30
+
+# advisory lock electing the worker filling the shared stores
+WARMUP_LOCK = 0x76726377
+
+# recorded calls not seen for this long are forgotten
+RETENTION = '7 days'
+
+# methods called on records rather than on the model
+RECORD_METHODS = {'read', 'read_combined'}
+
+_sources = []
+_running = set()            # dbnames being warmed up
+_running_lock = threading.Lock()
+_started = set()            # (pid, dbname) warmed up on their first request
+
+
+def register_warmup_source(func):
+    """ Register ``func(dbname, limit)``, returning an iterable of tuples
+        ``(model, method, arguments, uid, lang, website_id, hits)`` for the
+        most requested cache entries of ``dbname``, ``arguments`` being the
+        positional arguments that recompute the entry (for ``read``: the ids,
+        the fields and the load mode).
+    """
+    _sources.append(func)
+
+
+def warmup_enabled():
+    if tools.config.get('test_enable') or odoo.modules.module.current_test:
+        return False
+    return tools.str2bool(tools.config.get('view_record_cache_warmup', True), True)
+
+
+def _config_int(name, default):
+    try:
+        return int(tools.config.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def record_hot_calls(dbname, cr):
+    """ Remember the hottest entries of this worker as warm-up calls. """
+    if not warmup_enabled():
+        return
+    limit = _config_int('view_record_cache_warmup_size', DEFAULT_SIZE)
+    for func in _sources:
+        for model, method, arguments, uid, lang, website_id, hits in func(dbname, limit):
+            try:
+                arguments = repr(arguments)
+                ast.literal_eval(arguments)
+            except (ValueError, SyntaxError):
+                continue
+            cr.execute("""
+                INSERT INTO view_record_cache_warmup
+                    (model, method, arguments, user_id, lang, website_id, hits,
+                     recorded, active, last_seen, create_date, write_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, true, true,
+                        now() at time zone 'UTC', now() at time zone 'UTC', now() at time zone 'UTC')
+                ON CONFLICT (model, method, arguments, user_id, lang, website_id) DO UPDATE SET
+                    hits = GREATEST(view_record_cache_warmup.hits, EXCLUDED.hits),
+                    last_seen = EXCLUDED.last_seen,
+                    write_date = EXCLUDED.write_date
+            """, (model, method, arguments, uid, lang or '', website_id or 0, hits))
+    cr.execute("""
+        DELETE FROM view_record_cache_warmup
+        WHERE recorded AND last_seen < (now() at time zone 'UTC') - interval %s
+    """, (RETENTION,))
+
+register_flush_hook(record_hot_calls)
+
+
+def replay_call(env, model, method, arguments, uid, lang=None, website_id=None, context=None):
+    """ Call ``method`` of ``model`` with the positional ``arguments`` as the
+        user ``uid`` in the language and website of the original call; for
+        the methods of :data:`RECORD_METHODS`, the first argument is the
+        list of ids.
+    """
+    context = dict(context or {})
+    if lang:
+        context['lang'] = lang
+    if website_id:
+        context['website_id'] = website_id
+    records = env[model].sudo(uid).with_context(context)
+    if method in RECORD_METHODS:
+        ids, arguments = arguments[0], arguments[1:]
+        records = records.browse(ids)
+    return getattr(records, method)(*arguments)
+
+
+def warmup_worker(dbname):
+    """ Warm the caches of ``dbname`` up once per process, on its first
+        request: workers spawned later, e.g. recycled ones, start warm too,
+        and the prefork master never runs the replay.
+    """
+    key = (os.getpid(), dbname)
+    if key in _started or not can_start_threads():
+        return
+    _started.add(key)
+    start_warmup(dbname)
+
+
+def start_warmup(dbname, delay=None):
+    """ Replay the warm-up calls of ``dbname`` in a background thread,
+        unless one is already running; by default after the configured
+        delay and a random share of the spread, so that workers do not all
+        replay at once.
+    """
+    if not warmup_enabled():
+        return
+    with _running_lock:
+        if dbname in _running:
+            return
+        _running.add(dbname)
+    if delay is None:
+        delay = _config_int('view_record_cache_warmup_delay', DEFAULT_DELAY) + \
+            random.uniform(0, max(_config_int('view_record_cache_warmup_spread', DEFAULT_SPREAD), 0))
+    thread = threading.Thread(
+        target=_warmup_thread, args=(dbname, delay),
+        name='view_record_cache.warmup.%s' % dbname)
+    thread.daemon = True
+    thread.start()
+
+
+def _warmup_after_reset(dbname, model):
+    if can_start_threads():
+        start_warmup(dbname)
+
+register_reset_listener(_warmup_after_reset)
+
+
+def _warmup_thread(dbname, delay):
+    try:
+        time.sleep(delay)
+        with api.Environment.manage():
+            with odoo.registry(dbname).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                if tools.config.get('view_record_cache_store', 'local') != 'local':
+                    # one worker at a time fills the shared stores, the
+                    # others find its values there
+                    cr.execute("SELECT pg_try_advisory_xact_lock(%s)", (WARMUP_LOCK,))
+                    if not cr.fetchone()[0]:
+                        _logger.debug("Another worker is warming the view caches of %s up", dbname)
+                        return
+                if 'view.record.cache.warmup' in env:
+                    env['view.record.cache.warmup'].replay()
+    except Exception:
+        _logger.warning("View cache warm-up of %s failed", dbname, exc_info=True)
+    finally:
+        with _running_lock:
+            _running.discard(dbname)
+
+
+class ViewRecordCacheWarmup(models.Model):
+    """ A call replayed to fill the caches when a worker starts. """
+    _name = 'view.record.cache.warmup'
+    _description = 'View record cache warm-up call'
+    _order = 'hits desc, id'
+
+    model = fields.Char(string='Model', required=True, default='ir.ui.view')
+    method = fields.Selection([
+                            ('search', 'search'),
+                            ('search_read', 'search_read'),
+                            ('read', 'read'),
+                            ('read_combined', 'read_combined'),
+                            ],
+                            string='Method',
+                            required=True)
+    #~ Argumentos posicionales del metodo, como literal de python
+    arguments = fields.Text(
+                        string='Arguments',
+                        required=True,
+                        help="""Positional arguments of the method as a Python literal,
+                        for read: (ids, fields, load), for read_combined: (ids, fields)""")
+    user_id = fields.Many2one(
+                        'res.users',
+                        string='User',
+                        required=True,
+                        ondelete='cascade',
+                        default=lambda self: self.env.uid,
+                        help="""The call is replayed as this user, so that it fills
+                        the entries of his group set""")
+    lang = fields.Char(string='Language', default='')
+    website_id = fields.Integer(string='Website ID', default=0)
+    hits = fields.Integer(string='Hits', help="""Estimated popularity of the entry""")
+    recorded = fields.Boolean(
+                        string='Recorded',
+                        readonly=True,
+                        help="""Recorded from the hottest entries of the workers,
+                        unset for the calls entered by hand""")
+    last_seen = fields.Datetime(string='Last Seen', readonly=True)
+    active = fields.Boolean(string='Active', default=True)
+
+    _sql_constraints = [
+        ('call_uniq', 'unique (model, method, arguments, user_id, lang, website_id)',
+         'This warm-up call already exists.'),
+    ]
+
+    @api.model
+    def replay(self):
+        """ Replay the most popular calls; each call fills the caches since
+            it misses them.
+        """
+        limit = _config_int('view_record_cache_warmup_size', DEFAULT_SIZE)
+        calls = self.search([], limit=limit * 3)
+        start = time.time()
+        done = 0
+        for call in calls:
+            if call.model not in self.env:
+                continue
+            try:
+                arguments = ast.literal_eval(call.arguments)
+            except (ValueError, SyntaxError):
+                _logger.warning("Invalid warm-up arguments %r", call.arguments)
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    replay_call(self.env, call.model, call.method, arguments,
+                                call.user_id.id, call.lang, call.website_id)
+                done += 1
+            except Exception:
+                _logger.debug("Warm-up call %s failed", call.id, exc_info=True)
+        _logger.info("View cache warm-up replayed %d calls in %.2fs", done, time.time() - start)
+        return done
+
+    @api.model
+    def action_replay(self):
+        start_warmup(self.env.cr.dbname, delay=0)
+        return True
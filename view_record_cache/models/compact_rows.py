@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Compact representations of cached results.
+
+Id lists are kept as ``array('i')`` (4 bytes per id instead of a list slot
+plus an int object), and read rows are kept column-oriented: the field names
+are stored once in an interned schema tuple shared by every entry with the
+same fields, and each row is a plain tuple of values.  Dictionaries are only
+built when a caller asks for them; the mutable values they hold (x2many id
+lists) are copied too, so callers never get a reference to a cached
+container.
+"""
+
+import sys
+from array import array
+
+# Interned schemas kept at most; clients choose the field lists, so past
+# this number the tables start over, and entries keep their own tuples.
+MAX_SCHEMAS = 4096
+
+_schemas = {}       # schema: schema
+_positions = {}     # schema: {name: position}
+
+
+def intern_schema(names):
+    """ Return the shared tuple equal to ``names``. """
+    names = tuple(names)
+    schema = _schemas.get(names)
+    if schema is None:
+        if len(_schemas) >= MAX_SCHEMAS:
+            _schemas.clear()
+        schema = _schemas.setdefault(names, names)
+    return schema
+
+
+def _positions_of(schema):
+    positions = _positions.get(schema)
+    if positions is None:
+        if len(_positions) >= MAX_SCHEMAS:
+            _positions.clear()
+        positions = _positions.setdefault(schema, {name: index for index, name in enumerate(schema)})
+    return positions
+
+
+def copy_value(value):
+    """ Copy of the lists and dicts of a cached value, returned to callers. """
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    return value
+
+
+def pack_ids(ids):
+    """ Compact copy of a list of record ids. """
+    return array('i', ids)
+
+
+def _add_referenced_ids(ids, values):
+    # many2one pairs and x2many lists, whatever their model
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            ids.update(item for item in value if isinstance(item, int) and not isinstance(item, bool))
+
+
+class Rows(object):
+    """ Column-oriented list of rows sharing the same keys. """
+    __slots__ = ('schema', 'rows')
+
+    def __init__(self, schema, rows):
+        self.schema = intern_schema(schema)
+        self.rows = rows
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        if not dicts:
+            return cls((), ())
+        schema = tuple(dicts[0])
+        return cls(schema, tuple(tuple(row[name] for name in schema) for row in dicts))
+
+    def to_dicts(self):
+        schema = self.schema
+        return [dict(zip(schema, map(copy_value, row))) for row in self.rows]
+
+    def ids(self):
+        index = self.schema.index('id')
+        return [row[index] for row in self.rows]
+
+    def referenced_ids(self):
+        """ Ids of the rows and of the records their relational values
+            refer to, whatever their model.
+        """
+        ids = set(self.ids()) if 'id' in self.schema else set()
+        for row in self.rows:
+            _add_referenced_ids(ids, row)
+        return ids
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getstate__(self):
+        return (self.schema, self.rows)
+
+    def __setstate__(self, state):
+        schema, rows = state
+        self.schema = intern_schema(schema)
+        self.rows = rows
+
+    def cache_size(self, estimate):
+        # the schema is shared, only count the rows
+        return sys.getsizeof(self) + estimate(self.rows)
+
+
+class RecordValues(object):
+    """ Values of some fields of one record, in read and in cache format. """
+    __slots__ = ('schema', 'values', 'cache_values')
+
+    def __init__(self, schema, values, cache_values):
+        self.schema = intern_schema(schema)
+        self.values = values
+        self.cache_values = cache_values
+
+    def __contains__(self, name):
+        return name in _positions_of(self.schema)
+
+    def to_dict(self, names):
+        """ Read values of ``names``, as a new dict. """
+        index = _positions_of(self.schema)
+        values = self.values
+        return {name: copy_value(values[index[name]]) for name in names}
+
+    def cache_dict(self, names):
+        """ Cache-format values of ``names``, as a new dict. """
+        index = _positions_of(self.schema)
+        values = self.cache_values
+        return {name: values[index[name]] for name in names}
+
+    def referenced_ids(self):
+        """ Ids of the records the relational values refer to, whatever
+            their model.
+        """
+        ids = set()
+        _add_referenced_ids(ids, self.values)
+        return ids
+
+    def merged(self, values, cache_values):
+        """ Return a copy completed with the dicts ``values`` and
+            ``cache_values`` (in read and cache format).
+        """
+        index = _positions_of(self.schema)
+        names = [name for name in values if name not in index]
+        return RecordValues(
+            self.schema + tuple(names),
+            self.values + tuple(values[name] for name in names),
+            self.cache_values + tuple(cache_values[name] for name in names),
+        )
+
+    def __getstate__(self):
+        return (self.schema, self.values, self.cache_values)
+
+    def __setstate__(self, state):
+        schema, self.values, self.cache_values = state
+        self.schema = intern_schema(schema)
+
+    def cache_size(self, estimate):
+        return sys.getsizeof(self) + estimate(self.values) + estimate(self.cache_values)
+
+
+EMPTY_RECORD = RecordValues((), (), ())
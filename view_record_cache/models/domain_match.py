@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Conservative evaluation of domains on table rows.
+
+Selective invalidation must tell whether a changed record may belong to the
+result of a cached search.  :func:`may_match` evaluates a domain on the raw
+column values of the record, as fetched from its table, with the semantics
+of the SQL the ORM generates.  Leaves it cannot decide exactly (paths,
+hierarchical or negated set operators, translated or missing columns, values
+of another type, accents) are unknown, and a domain only fails to match when
+it is false whatever their value.
+"""
+
+import operator
+import re
+from functools import lru_cache
+
+from odoo.osv import expression
+
+from .cache_key import OPERATOR_ALIASES
+
+
+def may_match(domain, row):
+    """ Whether the record whose column values are ``row`` may satisfy
+        ``domain``.
+    """
+    try:
+        result = _evaluate(expression.normalize_domain(list(domain)), row)
+    except Exception:
+        return True
+    return result is not False
+
+
+def _evaluate(domain, row):
+    # three-valued logic: True, False or None (unknown)
+    stack = []
+    for term in reversed(domain):
+        if term == expression.NOT_OPERATOR:
+            value = stack.pop()
+            stack.append(None if value is None else not value)
+        elif term == expression.AND_OPERATOR:
+            first, second = stack.pop(), stack.pop()
+            if first is False or second is False:
+                stack.append(False)
+            else:
+                stack.append(True if first and second else None)
+        elif term == expression.OR_OPERATOR:
+            first, second = stack.pop(), stack.pop()
+            if first or second:
+                stack.append(True)
+            else:
+                stack.append(False if first is False and second is False else None)
+        else:
+            stack.append(_evaluate_leaf(term, row))
+    return stack.pop()
+
+
+def _evaluate_leaf(leaf, row):
+    if not isinstance(leaf, (list, tuple)) or len(leaf) != 3:
+        return None
+    leaf = tuple(leaf)
+    if leaf == expression.TRUE_LEAF:
+        return True
+    if leaf == expression.FALSE_LEAF:
+        return False
+    left, op, right = leaf
+    if not isinstance(left, str) or left not in row or not isinstance(op, str):
+        return None
+    op = op.lower()
+    func = _OPERATORS.get(OPERATOR_ALIASES.get(op, op))
+    return None if func is None else func(row[left], right)
+
+
+def _is_null(value):
+    # NULL, or false for a boolean column
+    return value is None or value is False
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _comparable(value, right):
+    # floats and dates are compared by the database with other rules
+    if isinstance(value, str):
+        return isinstance(right, str)
+    if isinstance(value, bool):
+        return isinstance(right, bool)
+    return _is_int(value) and _is_int(right)
+
+
+def _equal(value, right):
+    if right is False or right is None:
+        return _is_null(value)
+    if value is None:
+        return False
+    if not _comparable(value, right):
+        return None
+    return value == right
+
+
+def _not_equal(value, right):
+    # the ORM adds "OR column IS NULL" to negative comparisons
+    result = _equal(value, right)
+    return None if result is None else not result
+
+
+def _in(value, right):
+    if not isinstance(right, (list, tuple)):
+        return None
+    # like the ORM, which drops the values equal to False (0 and 0.0 too)
+    # from the list and matches NULL instead
+    items = [item for item in right if item != False]
+    if len(items) < len(right) and _is_null(value):
+        return True
+    if value is None:
+        return False
+    if any(not _comparable(value, item) for item in items):
+        return None
+    return value in items
+
+
+def _compare(func):
+    def compare(value, right):
+        if not _is_int(right):
+            return None
+        if value is None:
+            return False
+        if not _is_int(value):
+            return None
+        return func(value, right)
+    return compare
+
+
+def _like(wildcard, insensitive):
+    def like(value, right):
+        if not isinstance(right, str):
+            return None
+        if wildcard and not right:
+            # the ORM matches every value and NULL, but its negation, made
+            # "NOT LIKE '%%' OR column IS NULL", matches NULL too
+            return True if value is not None else None
+        if value is None:
+            return False
+        # case folding and unaccent are only predictable in ASCII
+        if not isinstance(value, str) or not _is_ascii(value) or not _is_ascii(right):
+            return None
+        pattern = _like_pattern('%' + right + '%' if wildcard else right, insensitive)
+        return pattern.match(value) is not None
+    return like
+
+
+def _is_ascii(value):
+    try:
+        value.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=1024)
+def _like_pattern(pattern, insensitive):
+    """ Regular expression equivalent to the SQL ``LIKE`` ``pattern``. """
+    parts = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    if escaped:
+        raise ValueError("LIKE pattern must not end with escape character")
+    return re.compile(''.join(parts) + r'\Z', re.DOTALL | (re.IGNORECASE if insensitive else 0))
+
+
+_OPERATORS = {
+    '=': _equal,
+    '!=': _not_equal,
+    'in': _in,
+    '<': _compare(operator.lt),
+    '>': _compare(operator.gt),
+    '<=': _compare(operator.le),
+    '>=': _compare(operator.ge),
+    'like': _like(True, False),
+    'ilike': _like(True, True),
+    '=like': _like(False, False),
+    '=ilike': _like(False, True),
+}
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+from .cache_signaling import record_all_changes
+
+
+class Module(models.Model):
+    _inherit = 'ir.module.module'
+
+    @api.multi
+    def write(self, vals):
+        # installed modules may add fields, views or groups: every cached
+        # lookup is stale once their state or version changes
+        if 'state' in vals or 'latest_version' in vals:
+            record_all_changes(self.env.cr)
+        return super(Module, self).write(vals)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+# translations of the fields of this model are served by its caches
+CACHED_TRANSLATIONS = 'ir.ui.view,'
+
+
+class IrTranslation(models.Model):
+    _inherit = 'ir.translation'
+
+    @api.multi
+    def _record_cache_views(self):
+        """ Views whose translated fields (``arch_db``, ...) are in ``self``. """
+        ids = {
+            translation.res_id for translation in self
+            if translation.res_id and (translation.name or '').startswith(CACHED_TRANSLATIONS)
+        }
+        return self.env['ir.ui.view'].browse(sorted(ids))
+
+    @api.multi
+    def _record_cache_invalidate_views(self):
+        # the cached reads and combined archs of their languages are stale
+        views = self._record_cache_views().exists()
+        if views:
+            views._record_cache_invalidate(views._record_cache_rows())
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(IrTranslation, self).create(vals_list)
+        records._record_cache_invalidate_views()
+        return records
+
+    @api.multi
+    def write(self, vals):
+        self._record_cache_invalidate_views()
+        res = super(IrTranslation, self).write(vals)
+        self._record_cache_invalidate_views()
+        return res
+
+    @api.multi
+    def unlink(self):
+        self._record_cache_invalidate_views()
+        return super(IrTranslation, self).unlink()
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""Bounded in-process store used by the ir.ui.view result caches.
+
+Every cached method owns one :class:`LRUCache` with an entry-count budget and
+a byte budget.  Eviction is least-recently-used; when the cache is full a
+TinyLFU admission filter (a small count-min sketch of recent key frequencies)
+decides whether the new key is worth more than the entries it would evict, so
+a burst of one-off lookups cannot flush the hot working set.
+
+Hits take no lock: the entry is read with a single dictionary lookup, and its
+recency is only updated when the lock of the cache is free, so concurrent
+readers never wait on each other and the order is approximately LRU under
+contention.  :class:`ShardedLRUCache` splits a cache in independently locked
+shards so that writers of different keys do not serialize either.
+"""
+
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+_SKETCH_DEPTH = 4
+_SKETCH_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+_COUNTER_MAX = 15
+
+
+def estimate_size(value):
+    """ Approximate number of bytes held by ``value``.
+
+    Walks lists, tuples, sets and dicts recursively; strings, numbers and
+    arrays use :func:`sys.getsizeof`; objects providing ``cache_size(estimate)``
+    report their own size.  Shared objects are counted once per reference, so
+    the result errs on the large side, which is what a budget wants.
+    """
+    cache_size = getattr(value, 'cache_size', None)
+    if cache_size is not None:
+        return cache_size(estimate_size)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class FrequencySketch(object):
+    """ Count-min sketch of key popularity with periodic aging.
+
+    Counters saturate at 15 and are all halved once ``10 * capacity`` keys have
+    been recorded, so the sketch follows the recent access distribution.
+    """
+
+    def __init__(self, capacity):
+        width = 64
+        while width < max(capacity, 1) * 2:
+            width <<= 1
+        self._mask = width - 1
+        self._rows = [array('B', bytes(width)) for _ in range(_SKETCH_DEPTH)]
+        self._sample_size = max(capacity, 1) * 10
+        self._additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        for seed in _SKETCH_SEEDS:
+            h2 = (h ^ seed) * 0x01000193
+            yield (h2 ^ (h2 >> 16)) & self._mask
+
+    def increment(self, key):
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < _COUNTER_MAX:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def frequency(self, key):
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _age(self):
+        for row in self._rows:
+            for index, count in enumerate(row):
+                if count:
+                    row[index] = count >> 1
+        self._additions //= 2
+
+
+class CacheStats(object):
+    """ Counters of one cache in this process.
+
+    ``hits``/``misses`` count local lookups, ``shared_hits`` the local misses
+    answered by the shared store, ``stale_hits`` the hits on entries older
+    than the time-to-live, ``coalesced`` the misses answered by a concurrent
+    computation of the same entry.  ``key_time`` is the time spent building
+    keys, ``miss_time`` the time spent computing ``computed`` missing values;
+    their average gives the time a hit saves.  Timings are updated without
+    locking and are approximate under concurrency.
+    """
+    __slots__ = ('hits', 'misses', 'shared_hits', 'stale_hits', 'coalesced', 'sets',
+                 'rejected', 'evictions', 'key_time', 'miss_time', 'computed')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def add_miss_time(self, elapsed, count=1):
+        self.miss_time += elapsed
+        self.computed += count
+
+    def time_saved(self):
+        if not self.computed:
+            return 0.0
+        return (self.hits + self.shared_hits + self.coalesced) * self.miss_time / self.computed
+
+    def as_dict(self):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values['time_saved'] = self.time_saved()
+        return values
+
+
+class LRUCache(object):
+    """ Thread-safe LRU mapping bounded by ``max_entries`` and ``max_bytes``.
+
+    A budget of ``0`` means unbounded on that axis.  Values larger than
+    ``max_value_bytes``, the whole byte budget by default, are never stored;
+    a larger value than the byte budget evicts every other entry.  Entries
+    older than ``ttl`` seconds (``0``: never) are still returned, but
+    :meth:`lookup` reports them stale.
+    """
+
+    def __init__(self, name, max_entries=0, max_bytes=0, admission=True, ttl=0, stats=None,
+                 max_value_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_bytes if max_value_bytes is None else max_value_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._data = OrderedDict()      # key: (value, size, meta, created)
+        self._lock = threading.RLock()
+        self._sketch = FrequencySketch(max_entries or 1024) if admission else None
+        self.stats = CacheStats() if stats is None else stats
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        return self.lookup(key, default)[0]
+
+    def lookup(self, key, default=None):
+        """ Return ``(value, meta, stale)`` for ``key``, ``stale`` telling
+            whether the entry outlived the time-to-live, or ``(default, None,
+            False)`` when it is missing.
+        """
+        if self._sketch is not None:
+            # unsynchronized: a lost increment only blurs the estimate
+            self._sketch.increment(key)
+        item = self._data.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return default, None, False
+        value, _size, meta, created = item
+        if self._lock.acquire(False):
+            try:
+                if key in self._data:
+                    self._data.move_to_end(key)
+            finally:
+                self._lock.release()
+        self.stats.hits += 1
+        if self.ttl and time.time() - created > self.ttl:
+            self.stats.stale_hits += 1
+            return value, meta, True
+        return value, meta, False
+
+    def set(self, key, value, size=None, meta=None, created=None):
+        """ Store ``value`` under ``key``; return whether it was admitted.
+
+        ``meta`` is kept along the entry for the caller, see :meth:`hottest`.
+        ``created`` is the time the value was computed, now by default.
+        """
+        if size is None:
+            size = estimate_size(value)
+        if self.max_value_bytes and size > self.max_value_bytes:
+            self.stats.rejected += 1
+            return False
+        with self._lock:
+            # the previous value stays when the new one is not admitted
+            victims = self._victims(key, size)
+            if victims is None:
+                self.stats.rejected += 1
+                return False
+            self._discard(key)
+            for victim in victims:
+                self._discard(victim)
+            self._data[key] = (value, size, meta, time.time() if created is None else created)
+            self.bytes += size
+            self.stats.sets += 1
+            self.stats.evictions += len(victims)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._discard(key)
+            return item[0]
+
+    def discard_if(self, predicate):
+        """ Remove the entries for which ``predicate(key, value)`` holds. """
+        with self._lock:
+            for key in [key for key, item in self._data.items() if predicate(key, item[0])]:
+                self._discard(key)
+
+    def shed(self, fraction):
+        """ Evict the least recently used entries holding about ``fraction``
+            of the bytes of the cache; return the number of bytes freed.
+        """
+        with self._lock:
+            return self.trim(self.bytes * fraction)
+
+    def trim(self, amount):
+        """ Evict the least recently used entries holding at least
+            ``amount`` bytes, or all of them; return the number of bytes
+            freed.
+        """
+        with self._lock:
+            before = self.bytes
+            victims = []
+            freed = 0
+            for key, item in self._data.items():
+                if freed >= amount:
+                    break
+                victims.append(key)
+                freed += item[1]
+            for key in victims:
+                self._discard(key)
+            self.stats.evictions += len(victims)
+            return before - self.bytes
+
+    def hottest(self, limit):
+        """ Return up to ``limit`` tuples ``(key, value, meta, frequency)`` of
+            the most frequently requested entries (the most recent ones when
+            the admission filter is disabled).
+        """
+        with self._lock:
+            items = [(key, item[0], item[2]) for key, item in self._data.items()]
+            sketch = self._sketch
+            if sketch is None:
+                ranked = [item + (0,) for item in reversed(items)]
+            else:
+                ranked = sorted(
+                    (item + (sketch.frequency(item[0]),) for item in items),
+                    key=lambda item: item[3], reverse=True)
+        return ranked[:limit]
+
+    def items(self):
+        """ Return a list of ``(key, value, meta, created)``, least recently
+            used first.
+        """
+        with self._lock:
+            return [(key, item[0], item[2], item[3]) for key, item in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def _discard(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+    def _victims(self, key, size):
+        """ Keys to evict so that ``key`` with ``size`` bytes fits, oldest
+            first, or ``None`` when the admission filter rejects ``key``.
+            A key already present replaces its entry and is always admitted.
+        """
+        count = len(self._data)
+        free = self.max_bytes - self.bytes if self.max_bytes else None
+        current = self._data.get(key)
+        if current is not None:
+            count -= 1
+            if free is not None:
+                free += current[1]
+        victims = []
+        candidate = None
+        for victim, (_value, victim_size, _meta, _created) in self._data.items():
+            entries_ok = not self.max_entries or count - len(victims) < self.max_entries
+            bytes_ok = free is None or free >= size
+            if entries_ok and bytes_ok:
+                break
+            if victim == key:
+                continue
+            if self._sketch is not None and current is None:
+                if candidate is None:
+                    candidate = self._sketch.frequency(key)
+                # ties go to the newcomer, the victim being the older entry
+                if self._sketch.frequency(victim) > candidate:
+                    return None
+            victims.append(victim)
+            if free is not None:
+                free += victim_size
+        return victims
+
+
+class ShardedLRUCache(object):
+    """ :class:`LRUCache` split in ``shards`` independently locked caches,
+        each with its share of the budgets; keys are assigned by hash.
+
+    A value larger than the byte share of its shard is still stored, as long
+    as it fits in the whole budget: it evicts the other entries of its shard,
+    then the least recently used entries of the other shards until the
+    cache is back within its budget.
+    """
+
+    def __init__(self, name, shards=8, max_entries=0, max_bytes=0, admission=True, ttl=0):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._mask = 1
+        while self._mask < shards:
+            self._mask <<= 1
+        count, self._mask = self._mask, self._mask - 1
+        self._shards = [
+            LRUCache(
+                '%s[%d]' % (name, index),
+                max_entries=-(-max_entries // count) if max_entries else 0,
+                max_bytes=-(-max_bytes // count) if max_bytes else 0,
+                admission=admission, ttl=ttl, stats=self.stats, max_value_bytes=max_bytes,
+            )
+            for index in range(count)
+        ]
+
+    def _shard(self, key):
+        return self._shards[hash(key) & self._mask]
+
+    @property
+    def bytes(self):
+        return sum(shard.bytes for shard in self._shards)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, key):
+        return key in self._shard(key)
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def lookup(self, key, default=None):
+        return self._shard(key).lookup(key, default)
+
+    def set(self, key, value, size=None, meta=None, created=None):
+        shard = self._shard(key)
+        stored = shard.set(key, value, size=size, meta=meta, created=created)
+        if stored and self.max_bytes:
+            excess = self.bytes - self.max_bytes
+            if excess > 0:
+                self._trim(excess, shard)
+        return stored
+
+    def _trim(self, amount, keep):
+        """ Free ``amount`` bytes in the shards other than ``keep``, the
+            fullest first.
+        """
+        for shard in sorted(self._shards, key=lambda shard: shard.bytes, reverse=True):
+            if amount <= 0:
+                break
+            if shard is not keep:
+                amount -= shard.trim(amount)
+
+    def pop(self, key, default=None):
+        return self._shard(key).pop(key, default)
+
+    def discard_if(self, predicate):
+        for shard in self._shards:
+            shard.discard_if(predicate)
+
+    def shed(self, fraction):
+        return sum(shard.shed(fraction) for shard in self._shards)
+
+    def hottest(self, limit):
+        ranked = []
+        for shard in self._shards:
+            ranked.extend(shard.hottest(limit))
+        ranked.sort(key=lambda item: item[3], reverse=True)
+        return ranked[:limit]
+
+    def items(self):
+        result = []
+        for shard in self._shards:
+            result.extend(shard.items())
+        return result
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
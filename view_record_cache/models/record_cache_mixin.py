@@ -0,0 +1,796 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import logging
+
+from odoo import models, api, tools
+from odoo.exceptions import MissingError
+
+from .record_cache import LRUCache, ShardedLRUCache
+from .compact_rows import EMPTY_RECORD, Rows, pack_ids
+from .cache_key import freeze, group_fingerprint, normalize_domain, normalize_fields, normalize_order, \
+    thaw_domain
+from .domain_match import may_match
+from .shared_store import create_store, store_path_prefix
+from .cache_stats import register_stats_source, watch_stats
+from .cache_memory import maybe_shed_caches, register_memory_source
+from .cache_warmup import register_warmup_source, warmup_worker
+from .cache_refresh import schedule_refresh
+from .cache_snapshot import get_snapshot, register_snapshot_source
+from .single_flight import SingleFlight
+from .cache_signaling import flush_partition, get_transaction, record_changes, \
+    register_invalidator, setup_signaling
+
+_logger = logging.getLogger(__name__)
+_logCache = logging.getLogger(__name__+'_Cache')
+
+# Default budgets of each cached method, overridable in the configuration
+# file with view_record_cache_<table>_<method>_max_entries / _max_bytes, or
+# for every model with view_record_cache_<method>_max_entries / _max_bytes.
+CACHE_BUDGETS = {
+    'search': (4096, 8 * 1024 * 1024),
+    'search_read': (1024, 32 * 1024 * 1024),
+    'read': (16384, 32 * 1024 * 1024),
+}
+
+# Default geometry of the shared stores: number of slots, bytes per slot.
+SHARED_GEOMETRY = {
+    'search': (8192, 2048),
+    'search_read': (2048, 16384),
+    'read': (8192, 8192),
+}
+
+# Shards of each cache; in threaded and gevent servers, writers of keys in
+# different shards do not wait for each other.
+DEFAULT_SHARDS = 8
+
+def _search_depends(key, value, ids, rows):
+    """ Whether the domain of a search entry may match a changed record,
+        before or after the change.
+    """
+    if rows is None or key[0] == 'sql':
+        return True
+    domain = thaw_domain(key[0])
+    return any(may_match(domain, row) for row in rows)
+
+
+def _search_read_depends(key, value, ids, rows):
+    # rows also show the values of the records they refer to
+    return _search_depends(key, value, ids, rows) or not ids.isdisjoint(value.referenced_ids())
+
+
+def _read_depends(key, value, ids, rows):
+    # many2one values show the names of the records they refer to
+    return key[0] in ids or not ids.isdisjoint(value.referenced_ids())
+
+
+# Methods whose entries only depend on some records, with the predicate
+# telling whether an entry depends on a set of changed ids whose column
+# values before and after the changes are rows (None when unknown):
+# method: func(key, value, ids, rows).
+SELECTIVE_METHODS = {
+    'search': _search_depends,
+    'search_read': _search_read_depends,
+    'read': _read_depends,
+}
+
+# Methods whose entries in the partition of a website do not depend on the
+# records of other websites, with the predicate telling whether a changed
+# record only matters to its own website: method: func(row).
+WEBSITE_SCOPED_METHODS = {}
+
+# Types of the columns fetched for the changed records, whose values the
+# domains of the search entries are matched against.
+ROW_FIELD_TYPES = ('boolean', 'char', 'integer', 'many2one', 'selection')
+
+# Methods called on records, with the function returning the positional
+# arguments (ids first) of the call computing an entry: method: func(key, value).
+RECORD_CALLS = {
+    'read': lambda key, value: ([key[0]], [name for name in value.schema if name != 'id'], key[1]),
+}
+
+# Longest id list kept by the ``search`` caches; larger results are marked
+# as such and every page of them is searched in SQL.
+DEFAULT_SEARCH_MAX_IDS = 5000
+
+# Keys of the ``search`` entries: ``groups`` builds them from the domain and
+# the group set of the user, ``sql`` from the query left once the record
+# rules are applied, shared by every user whose access yields the same query.
+SEARCH_KEY_MODES = ('groups', 'sql')
+
+# Website partitions of a database; calls of the websites beyond them are
+# served by the backend partition.
+DEFAULT_MAX_WEBSITES = 16
+
+# Seconds during which the website ids of a database are trusted; an
+# unknown id only reloads them once they are older.
+WEBSITE_IDS_TTL = 60
+
+# Values of the context keys missing from the context.
+CONTEXT_DEFAULTS = {
+    'active_test': True,
+}
+
+_record_caches = {}         # (dbname, model, method, partition): LRUCache
+_shared_stores = {}         # (dbname, model, method, partition): store or None
+_record_caches_lock = threading.Lock()
+_websites = {}              # dbname: (website ids, time.monotonic() of the load)
+_website_partitions = {}    # dbname: set of the website partitions in use
+_flights = SingleFlight()
+
+# seconds a request waits for a concurrent computation of the same entry
+DEFAULT_FLIGHT_TIMEOUT = 10
+
+
+def _config_int(name, default):
+    try:
+        return int(tools.config.get(name, default))
+    except (TypeError, ValueError):
+        _logger.warning("Invalid integer for option %s, using %s", name, default)
+        return default
+
+
+def partition_names(partition):
+    """ Names the options of ``partition`` may be set under, the most
+        specific last: ``website_3`` is configured as ``website`` first.
+    """
+    if not partition:
+        return ()
+    kind = partition.split('_', 1)[0]
+    return (kind, partition) if kind != partition else (partition,)
+
+
+def _config_option(table, method, suffix, default, partition=None):
+    """ Integer option ``view_record_cache_<table>_<partition>_<method>_<suffix>``,
+        falling back on ``view_record_cache_<partition>_<method>_<suffix>``,
+        ``view_record_cache_<table>_<method>_<suffix>`` and
+        ``view_record_cache_<method>_<suffix>``.
+    """
+    names = ['%s_%s' % (method, suffix), '%s_%s_%s' % (table, method, suffix)]
+    for name in partition_names(partition):
+        names += ['%s_%s_%s' % (name, method, suffix),
+                  '%s_%s_%s_%s' % (table, name, method, suffix)]
+    for name in names:
+        default = _config_int('view_record_cache_' + name, default)
+    return default
+
+
+def partition_enabled(partition):
+    """ Whether the ``view_record_cache_<partition>`` option, ``True`` by
+        default, lets ``partition`` be cached.
+    """
+    enabled = True
+    for name in partition_names(partition):
+        enabled = tools.str2bool(tools.config.get('view_record_cache_' + name, enabled), enabled)
+    return enabled
+
+
+def get_record_cache(dbname, model, method, table=None, partition=None):
+    """ Return the bounded cache of ``method`` of ``model`` for ``dbname``
+        in ``partition``.
+    """
+    key = (dbname, model, method, partition)
+    cache = _record_caches.get(key)
+    if cache is None:
+        with _record_caches_lock:
+            cache = _record_caches.get(key)
+            if cache is None:
+                table = table or model.replace('.', '_')
+                max_entries, max_bytes = CACHE_BUDGETS[method]
+                options = dict(
+                    max_entries=_config_option(table, method, 'max_entries', max_entries, partition),
+                    max_bytes=_config_option(table, method, 'max_bytes', max_bytes, partition),
+                    admission=tools.str2bool(tools.config.get('view_record_cache_admission', True), True),
+                    ttl=_config_option(table, method, 'ttl', 0, partition),
+                )
+                name = '%s %s %s' % (model, method, partition or '')
+                shards = _config_int('view_record_cache_shards', DEFAULT_SHARDS)
+                if shards > 1:
+                    cache = ShardedLRUCache(name.strip(), shards=shards, **options)
+                else:
+                    cache = LRUCache(name.strip(), **options)
+                _record_caches[key] = cache
+    return cache
+
+
+def get_shared_store(dbname, model, method, table=None, partition=None):
+    """ Return the store shared by the workers of this host for ``method``
+        of ``model`` on ``dbname`` in ``partition``, or ``None`` when only
+        local caches are configured.
+    """
+    key = (dbname, model, method, partition)
+    try:
+        return _shared_stores[key]
+    except KeyError:
+        pass
+    with _record_caches_lock:
+        if key not in _shared_stores:
+            table = table or model.replace('.', '_')
+            slots, slot_size = SHARED_GEOMETRY[method]
+            store = None
+            try:
+                store = create_store(
+                    tools.config.get('view_record_cache_store', 'local'),
+                    store_path_prefix(tools.config.get('view_record_cache_store_dir'),
+                                      dbname, '-'.join(filter(None, (table, method, partition)))),
+                    slots=_config_option(table, method, 'shared_slots', slots, partition),
+                    slot_size=_config_option(table, method, 'shared_slot_size', slot_size, partition),
+                )
+            except (OSError, ValueError):
+                _logger.warning("Cannot open the shared %s %s cache, using local caches only",
+                                model, method, exc_info=True)
+            _shared_stores[key] = store
+    return _shared_stores[key]
+
+
+def website_partition(env, website_id):
+    """ Name of the partition of the website ``website_id``: ``website_<id>``
+        for an existing website, as long as the database has less than
+        ``view_record_cache_max_websites`` of them, else ``backend``.  The
+        context is controlled by the caller, and every partition has its own
+        caches and shared stores.
+    """
+    try:
+        website_id = int(website_id)
+    except (TypeError, ValueError):
+        return 'backend'
+    dbname = env.cr.dbname
+    partition = 'website_%d' % website_id
+    used = _website_partitions.get(dbname, ())
+    if partition in used:
+        return partition
+    if website_id not in _website_ids(env):
+        return 'backend'
+    with _record_caches_lock:
+        used = _website_partitions.setdefault(dbname, set())
+        if partition not in used:
+            if len(used) >= _config_int('view_record_cache_max_websites', DEFAULT_MAX_WEBSITES):
+                return 'backend'
+            used.add(partition)
+    return partition
+
+
+def _website_ids(env):
+    """ Ids of the websites of the database, reloaded at most once per
+        :data:`WEBSITE_IDS_TTL` seconds.
+    """
+    ids, loaded = _websites.get(env.cr.dbname, (frozenset(), None))
+    if loaded is None or time.monotonic() - loaded > WEBSITE_IDS_TTL:
+        ids = frozenset()
+        if 'website' in env:
+            env.cr.execute('SELECT id FROM website')
+            ids = frozenset(row[0] for row in env.cr.fetchall())
+        _websites[env.cr.dbname] = (ids, time.monotonic())
+    return ids
+
+
+def clear_record_caches(dbname, model, ids=None, rows=None, partition=None):
+    """ Drop the cached lookups of ``model`` on ``dbname`` affected by
+        changes to the records ``ids``, whose column values before and after
+        the changes are ``rows`` (``None`` when unknown): the entries of the
+        methods in :data:`SELECTIVE_METHODS` are only dropped when they
+        depend on them, the others are all dropped.  With ``partition``,
+        only the caches of that partition are affected.
+    """
+    if ids is not None:
+        ids = set(ids)
+    for (cache_dbname, cache_model, method, cache_partition), cache in list(_record_caches.items()):
+        if cache_dbname != dbname or cache_model != model:
+            continue
+        if partition and cache_partition != partition:
+            continue
+        if method in WEBSITE_SCOPED_METHODS and \
+                _other_websites(cache_partition, rows, WEBSITE_SCOPED_METHODS[method]):
+            continue
+        depends = SELECTIVE_METHODS.get(method)
+        if ids is None or depends is None:
+            cache.clear()
+        else:
+            cache.discard_if(lambda key, entry: depends(key, entry, ids, rows))
+
+
+def _other_websites(partition, rows, scoped):
+    """ Whether the changed ``rows`` all belong to websites other than the
+        one of ``partition`` and only matter to their own website.
+    """
+    if not rows or not partition.startswith('website_'):
+        return False
+    return all(
+        row.get('website_id') and 'website_%s' % row['website_id'] != partition and scoped(row)
+        for row in rows
+    )
+
+
+def _iter_record_caches(dbname):
+    for (cache_dbname, model, method, partition), cache in list(_record_caches.items()):
+        if cache_dbname == dbname:
+            yield model, method, partition, cache
+
+register_stats_source(_iter_record_caches)
+register_snapshot_source(_iter_record_caches)
+
+
+def _all_record_caches():
+    return list(_record_caches.values())
+
+register_memory_source(_all_record_caches)
+
+
+def call_arguments(method, key, value):
+    """ Positional arguments of the call computing the entry ``key`` of
+        ``method``; for the methods of :data:`RECORD_CALLS`, the ids come
+        first.
+    """
+    if method in RECORD_CALLS:
+        return RECORD_CALLS[method](key, value)
+    if method == 'search':
+        if key[0] == 'sql':
+            # the domain cannot be recovered from the query
+            return None
+        # entries hold every page of the search
+        return (thaw_domain(key[0]), 0, None, key[1], False)
+    return (thaw_domain(key[0]),) + key[1:5]
+
+
+def _hot_calls(dbname, limit):
+    """ Calls recomputing the hottest cached lookups of ``dbname``; reads of
+        the same fields by the same user are merged into one call.
+    """
+    for model, method, _partition, cache in _iter_record_caches(dbname):
+        reads = {}
+        for key, value, meta, hits in cache.hottest(limit):
+            if meta is None:
+                continue
+            arguments = call_arguments(method, key, value)
+            if arguments is None:
+                continue
+            if method != 'read':
+                yield (model, method, arguments) + meta + (hits,)
+                continue
+            ids, names, load = arguments
+            call = reads.setdefault((tuple(names), load) + meta, [[], 0])
+            call[0].extend(ids)
+            call[1] = max(call[1], hits)
+        for (names, load, uid, lang, website_id), (ids, hits) in reads.items():
+            yield (model, 'read', (sorted(ids), list(names), load),
+                   uid, lang, website_id, hits)
+
+register_warmup_source(_hot_calls)
+
+
+class RecordCacheMixin(models.AbstractModel):
+    """ Cache the results of ``search``, ``search_read`` and ``read``.
+
+    Models opt in by inheriting from the mixin and listing the methods to
+    cache in ``_record_cache_methods``::
+
+        class IrUiMenu(models.Model):
+            _name = 'ir.ui.menu'
+            _inherit = ['ir.ui.menu', 'record.cache.mixin']
+            _record_cache_methods = ('search', 'read')
+
+    Keys hold the group set of the user and the values of the context keys
+    listed per method in ``_record_cache_context``; set
+    ``_record_cache_per_user`` when the record rules of the model depend on
+    the user itself.  The caches are
+    dropped by ``create``, ``write`` and ``unlink``; code changing the table
+    in SQL must call :meth:`_record_cache_invalidate` itself.
+    """
+    _name = 'record.cache.mixin'
+    _description = 'Cached lookups'
+
+    _record_cache_methods = ()
+    _record_cache_per_user = False
+    _record_cache_context = {
+        'search': ('lang', 'active_test'),
+        'search_read': ('lang', 'active_test'),
+        'read': ('lang',),
+    }
+
+    def _record_cache_enabled(self, method):
+        """ Whether ``method`` is served from the cache in this environment;
+            ``record_cache_disabled`` in the context bypasses every cache.
+        """
+        context = self.env.context
+        if method not in self._record_cache_methods or context.get('install_mode') \
+                or context.get('record_cache_disabled'):
+            return False
+        return partition_enabled(self._record_cache_partition())
+
+    def _record_cache_partition(self):
+        """ Name of the caches serving this environment: every website and
+            the backend have separate caches, budgets and statistics.
+        """
+        website_id = self.env.context.get('website_id')
+        return website_partition(self.env, website_id) if website_id else 'backend'
+
+    def _record_cache(self, method):
+        """ Bounded cache holding the results of ``method`` on this database. """
+        return get_record_cache(self.env.cr.dbname, self._name, method, self._table,
+                                self._record_cache_partition())
+
+    def _record_cache_scope(self):
+        """ Part of the keys identifying who may see an entry. """
+        if self._record_cache_per_user:
+            return (group_fingerprint(self.env), self.env.uid)
+        return (group_fingerprint(self.env),)
+
+    def _record_cache_context_values(self, method):
+        """ Values of the context keys the results of ``method`` depend on. """
+        context = self.env.context
+        return {
+            name: context.get(name, CONTEXT_DEFAULTS.get(name))
+            for name in self._record_cache_context.get(method, ())
+        }
+
+    def _record_cache_context_key(self, method):
+        """ Part of the keys of ``method`` holding the context values. """
+        context = self.env.context
+        return tuple(
+            freeze(context.get(name, CONTEXT_DEFAULTS.get(name)))
+            for name in self._record_cache_context.get(method, ())
+        )
+
+    def _record_cache_meta(self):
+        """ Who asked for an entry, to replay the call when warming up. """
+        context = self.env.context
+        return (self.env.uid, context.get('lang'), context.get('website_id'))
+
+    def _record_cache_get(self, method, key):
+        """ Cached value of ``key``, or ``None`` when it is missing or the
+            current transaction may not use the cache.
+        """
+        watch_stats(self.env.cr.dbname)
+        warmup_worker(self.env.cr.dbname)
+        transaction = get_transaction(self.env.cr)
+        if not transaction.can_read() or self.env.context.get('record_cache_refresh'):
+            return None
+        cache = self._record_cache(method)
+        value, meta, stale = cache.lookup(key)
+        if value is None:
+            found = self._record_cache_get_shared(method, key, transaction)
+            if found is not None:
+                created, value = found
+                meta = self._record_cache_meta()
+                stale = bool(cache.ttl) and time.time() - created > cache.ttl
+                cache.stats.shared_hits += 1
+                if transaction.can_store():
+                    cache.set(key, value, meta=meta, created=created)
+        if stale and meta is not None:
+            arguments = call_arguments(method, key, value)
+            if arguments is None:
+                # serve the stale value one last time
+                cache.pop(key)
+            else:
+                # serve the stale value and recompute it in the background
+                schedule_refresh(
+                    self.env.cr.dbname, self._name, method, key, arguments, meta,
+                    lambda: cache.pop(key), context=self._record_cache_context_values(method))
+        return value
+
+    def _record_cache_get_shared(self, method, key, transaction):
+        """ Return ``(created, value)`` of ``key`` from the store shared by
+            the workers of the host, else from the snapshot left by a previous
+            run, or ``None``.
+        """
+        dbname = self.env.cr.dbname
+        partition = self._record_cache_partition()
+        stamp = transaction.stamp(self._name, partition)
+        shared = get_shared_store(dbname, self._name, method, self._table, partition)
+        if shared is not None:
+            found = shared.get(key, stamp)
+            if isinstance(found, tuple) and len(found) == 2:
+                return found
+        snapshot = get_snapshot(dbname)
+        if snapshot is not None:
+            return snapshot.get(self._name, method, partition, key, stamp)
+        return None
+
+    def _record_cache_set(self, method, key, value):
+        """ Store ``value`` in the local cache and publish it in the shared
+            store, tagged with the stamp seen by the current transaction.
+        """
+        transaction = get_transaction(self.env.cr)
+        if not transaction.can_store():
+            return
+        maybe_shed_caches()
+        created = time.time()
+        self._record_cache(method).set(key, value, meta=self._record_cache_meta(), created=created)
+        partition = self._record_cache_partition()
+        shared = get_shared_store(self.env.cr.dbname, self._name, method, self._table, partition)
+        if shared is not None:
+            # keep the age of the value, for the time-to-live of other workers
+            shared.set(key, (created, value), transaction.stamp(self._name, partition))
+
+    def _record_cache_compute(self, method, key, compute):
+        """ Compute a missing entry with ``compute()`` and store it.
+
+        Concurrent requests of this process missing the same key while it is
+        computed wait for the result instead of computing it again.
+        """
+        transaction = get_transaction(self.env.cr)
+        timeout = _config_int('view_record_cache_single_flight_timeout', DEFAULT_FLIGHT_TIMEOUT)
+        if not timeout or not transaction.can_store():
+            value = compute()
+            self._record_cache_set(method, key, value)
+            return value
+        cache = self._record_cache(method)
+        tag = (transaction.generation, transaction.stamp(self._name, self._record_cache_partition()))
+        value, coalesced = _flights.run(
+            (self.env.cr.dbname, self._name, method, key), tag, compute, timeout)
+        if coalesced:
+            cache.stats.coalesced += 1
+        else:
+            self._record_cache_set(method, key, value)
+            _logCache.debug('SET %s %s %r - %d ' % (self._name, method, key, len(cache)))
+        return value
+
+    @api.multi
+    def _record_cache_invalidate(self, rows=None):
+        """ Drop the cached lookups affected by changes to ``self`` in this
+            worker now, and in the other workers once the transaction commits.
+
+        :param rows: column values of ``self`` before or after the change,
+            see :meth:`_record_cache_rows`; when ``None``, every search entry
+            of the model is dropped
+        """
+        if self._record_cache_methods:
+            record_changes(self.env.cr, self._name, self.ids, rows)
+
+    @api.multi
+    def _record_cache_rows(self):
+        """ Values of the columns of ``self`` the domains of the search
+            entries are matched against, one dict per record, or ``None``
+            when the searches are not cached selectively.
+        """
+        if not {'search', 'search_read'} & set(self._record_cache_methods) \
+                or self.env.context.get('install_mode'):
+            return None
+        if not self:
+            return []
+        names = ['id'] + [
+            name for name, field in self._fields.items()
+            if name != 'id' and field.store and field.column_type
+            and field.type in ROW_FIELD_TYPES and not field.translate
+        ]
+        rows = []
+        for sub_ids in self.env.cr.split_for_in_conditions(self.ids):
+            self.env.cr.execute('SELECT %s FROM "%s" WHERE id IN %%s' % (
+                ', '.join('"%s"' % name for name in names), self._table), (sub_ids,))
+            rows.extend(self.env.cr.dictfetchall())
+        return rows
+
+    @api.model
+    def _setup_complete(self):
+        super(RecordCacheMixin, self)._setup_complete()
+        if self._record_cache_methods:
+            model = self._name
+            register_invalidator(model, lambda dbname, ids, rows, partition:
+                                 clear_record_caches(dbname, model, ids, rows, partition))
+
+    @api.model
+    def _record_cache_flush(self, partition):
+        """ Drop every entry of ``partition`` of this model, in every worker. """
+        flush_partition(self.env.cr.dbname, partition, [self._name])
+
+    @api.model_cr
+    def init(self):
+        super(RecordCacheMixin, self).init()
+        if self._record_cache_methods:
+            setup_signaling(self.env.cr)
+            record_changes(self.env.cr, self._name)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(RecordCacheMixin, self).create(vals_list)
+        records._record_cache_invalidate(records._record_cache_rows())
+        return records
+
+    @api.multi
+    def write(self, vals):
+        # searches matching the records before or after the change are dropped
+        self._record_cache_invalidate(self._record_cache_rows())
+        res = super(RecordCacheMixin, self).write(vals)
+        self._record_cache_invalidate(self._record_cache_rows())
+        return res
+
+    @api.multi
+    def unlink(self):
+        self._record_cache_invalidate(self._record_cache_rows())
+        return super(RecordCacheMixin, self).unlink()
+
+    @api.model
+    @api.returns('self',
+        upgrade=lambda self, value, args, offset=0, limit=None, order=None, count=False: value if count else self.browse(value),
+        downgrade=lambda self, value, args, offset=0, limit=None, order=None, count=False: value if count else value.ids)
+    def search(self, args, offset=0, limit=None, order=None, count=False):
+        """ The whole ordered id list of a domain is cached once, and every
+            ``offset``/``limit`` page and ``count`` is served from it.  Lists
+            longer than the ``max_ids`` option are not kept: the entry only
+            records that the search is too large, and its pages are searched
+            in SQL.
+        """
+        if not self._record_cache_enabled('search'):
+            return super(RecordCacheMixin, self).search(args, offset=offset, limit=limit, order=order, count=count)
+        _cache = self._record_cache('search')
+        start = time.perf_counter()
+        key = self._record_cache_search_key(args, order)
+        _cache.stats.key_time += time.perf_counter() - start
+        ids = self._record_cache_get('search', key)
+        if ids is None:
+            max_ids = _config_option(self._table, 'search', 'max_ids', DEFAULT_SEARCH_MAX_IDS,
+                                     self._record_cache_partition())
+
+            def compute():
+                start = time.perf_counter()
+                res = self._search(args, order=order, limit=max_ids + 1 if max_ids else None)
+                _cache.stats.add_miss_time(time.perf_counter() - start)
+                return False if max_ids and len(res) > max_ids else pack_ids(res)
+            ids = self._record_cache_compute('search', key, compute)
+        if ids is False:
+            return super(RecordCacheMixin, self).search(args, offset=offset, limit=limit, order=order, count=count)
+        if count:
+            # like _search, counts ignore offset and limit
+            return len(ids)
+        offset = offset or 0
+        return self.browse(ids[offset:offset + limit] if limit else ids[offset:])
+
+    @api.model
+    def _record_cache_search_key(self, args, order):
+        """ Key of the ``search`` entry of ``args`` and ``order``, built as
+            the ``view_record_cache_search_key`` option tells (see
+            :data:`SEARCH_KEY_MODES`).
+        """
+        mode = tools.config.get('view_record_cache_%s_search_key' % self._table) or \
+            tools.config.get('view_record_cache_search_key') or 'groups'
+        if mode != 'sql':
+            return (normalize_domain(args), normalize_order(order), self._record_cache_context_key('search')) \
+                + self._record_cache_scope()
+        # compile the query like _search does, record rules included
+        self.check_access_rights('read')
+        query = self._where_calc(args)
+        self._apply_ir_rules(query, 'read')
+        order_by = self._generate_order_by(order, query)
+        from_clause, where_clause, params = query.get_sql()
+        return ('sql', from_clause, where_clause, freeze(params), order_by,
+                self._record_cache_context_key('search'))
+
+    @api.model
+    def search_read(self, domain=None, fields=None, offset=0, limit=None, order=None):
+        if not self._record_cache_enabled('search_read'):
+            return super(RecordCacheMixin, self).search_read(
+                domain=domain, fields=fields, offset=offset, limit=limit, order=order)
+        _cache = self._record_cache('search_read')
+        start = time.perf_counter()
+        key = (normalize_domain(domain), normalize_fields(fields), offset or 0, limit or None,
+               normalize_order(order), self._record_cache_context_key('search_read')) \
+            + self._record_cache_scope()
+        _cache.stats.key_time += time.perf_counter() - start
+        cached = self._record_cache_get('search_read', key)
+        if cached is None:
+            def compute():
+                start = time.perf_counter()
+                result = super(RecordCacheMixin, self).search_read(
+                    domain=domain, fields=fields, offset=offset, limit=limit, order=order)
+                _cache.stats.add_miss_time(time.perf_counter() - start)
+                return Rows.from_dicts(result)
+            cached = self._record_cache_compute('search_read', key, compute)
+        return cached.to_dicts()
+
+    @api.multi
+    def read(self, fields=None, load='_classic_read'):
+        """ Values are cached per record, load mode, context and group set,
+            so reads of overlapping ids or fields reuse each other: only the
+            missing (record, field) pairs are fetched, in one batch.
+        """
+        if not self._record_cache_enabled('read'):
+            return super(RecordCacheMixin, self).read(fields=fields, load=load)
+
+        # check access rights
+        self.check_access_rights('read')
+        fields = self.check_field_access_rights('read', fields)
+        names = []
+        for name in fields:
+            if name in self._fields:
+                names.append(name)
+            else:
+                _logger.warning("%s.read() with unknown field '%s'", self._name, name)
+
+        _cache = self._record_cache('read')
+        start = time.perf_counter()
+        scope = (load, self._record_cache_context_key('read')) + self._record_cache_scope()
+        _cache.stats.key_time += time.perf_counter() - start
+        entries = {}
+        missing_ids = []
+        missing_names = set()
+        for record_id in self._ids:
+            if record_id in entries:
+                continue
+            entry = self._record_cache_get('read', (record_id,) + scope)
+            entries[record_id] = entry
+            missing = names if entry is None else [name for name in names if name not in entry]
+            if missing:
+                missing_ids.append(record_id)
+                missing_names.update(missing)
+
+        if missing_ids:
+            start = time.perf_counter()
+            fetched = self.browse(missing_ids, self._prefetch)
+            # split fields into stored and computed fields
+            stored, inherited, computed = [], [], []
+            for name in missing_names:
+                field = self._fields[name]
+                if field.store:
+                    stored.append(name)
+                elif field.base_field.store:
+                    inherited.append(name)
+                else:
+                    computed.append(name)
+
+            # fetch stored fields from the database to the cache; this should feed
+            # the prefetching of secondary records
+            fetched._read_from_database(stored, inherited)
+
+            # retrieve values from records; this takes values from the cache and
+            # computes remaining fields
+            name_fields = [(name, self._fields[name]) for name in (stored + inherited + computed)]
+            use_name_get = (load == '_classic_read')
+            for record in fetched:
+                try:
+                    new_values = {
+                        name: field.convert_to_read(record[name], record, use_name_get)
+                        for name, field in name_fields
+                    }
+                except MissingError:
+                    entries[record.id] = None
+                    continue
+                # keep the values in cache format too, so that hits can feed
+                # the record cache without converting them again
+                entry = (entries[record.id] or EMPTY_RECORD).merged(
+                    new_values, record._convert_to_cache(new_values, validate=False))
+                entries[record.id] = entry
+                self._record_cache_set('read', (record.id,) + scope, entry)
+            _cache.stats.add_miss_time(time.perf_counter() - start, len(missing_ids))
+            _logCache.debug('SET %s read %d records %r - %d ' % (
+                self._name, len(missing_ids), sorted(missing_names), len(_cache)))
+
+        result = []
+        for record_id in self._ids:
+            entry = entries[record_id]
+            if entry is None:
+                continue
+            values = {'id': record_id}
+            values.update(entry.to_dict(names))
+            result.append(values)
+
+        # store result in cache for POST fields
+        missing_ids = set(missing_ids)
+        self._record_cache_hydrate({
+            record_id: entry
+            for record_id, entry in entries.items()
+            if entry is not None and record_id not in missing_ids
+        }, names)
+        return result
+
+    @api.multi
+    def _record_cache_hydrate(self, cache_values, names):
+        """ Load cached values into the record cache of the environment.
+
+        :param cache_values: ``{record_id: RecordValues}``
+        :param names: the field names to load for every record
+
+        Values are loaded field by field for all records at once, and only
+        for the records of the prefetch set of ``self``.
+        """
+        prefetch = self._prefetch.get(self._name, ())
+        ids = [record_id for record_id in cache_values if record_id in prefetch]
+        if not ids:
+            return
+        records = self.browse(ids, self._prefetch)
+        rows = [cache_values[record_id].cache_dict(names) for record_id in ids]
+        cache = self.env.cache
+        for name in names:
+            if name == 'id':
+                continue
+            cache.update(records, self._fields[name], [row[name] for row in rows])
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Second-level stores shared by the workers of one host.
+
+The per-worker :class:`~.record_cache.LRUCache` stays in front; on a local
+miss the cache looks up the configured shared store, and a value computed by
+one worker is published there so every other worker on the node can reuse
+it.  Stores are pluggable through :func:`register_store`; the ``shm`` store
+shipped here is a fixed-size hash table in a memory-mapped file, in
+``/dev/shm`` when available.
+
+Every value is tagged with the signaling stamp of its model (see
+:mod:`.cache_signaling`): a reader only accepts entries computed under the
+stamp its own transaction saw, so a view change invalidates the shared tier
+without touching the file.
+"""
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+# values whose pickle is larger than this are zlib-compressed
+COMPRESS_THRESHOLD = 1024
+FLAG_ZLIB = 1
+
+# slot header: seqlock counter, key digest, stamp, payload length, flags
+_HEADER = struct.Struct('<Q16sqII')
+_SEQ = struct.Struct('<Q')
+# the header without its counter, written while the counter is odd
+_FIELDS = struct.Struct('<16sqII')
+_READ_RETRIES = 3
+
+# thread locks of a store, each guarding every slot of the same index modulo
+# this number; fcntl locks are per process and do not exclude threads
+LOCK_STRIPES = 64
+
+_stores = {}
+
+
+def register_store(name, factory):
+    """ Make ``factory(path_prefix, **options)`` available as the store
+        named ``name`` in the ``view_record_cache_store`` option.
+    """
+    _stores[name] = factory
+
+
+def create_store(name, path_prefix, **options):
+    """ Instantiate the store ``name``, or return ``None`` for ``local``. """
+    if not name or name == 'local':
+        return None
+    factory = _stores.get(name)
+    if factory is None:
+        _logger.warning("Unknown view_record_cache_store %r, using local caches only", name)
+        return None
+    return factory(path_prefix, **options)
+
+
+def encode_key(key):
+    """ Stable 16-byte digest of a cache key, identical in every worker. """
+    return hashlib.sha1(repr(key).encode('utf-8')).digest()[:16]
+
+
+def dumps(value):
+    """ Compact serialization of a cached value; returns ``(flags, data)``. """
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if len(data) > COMPRESS_THRESHOLD:
+        packed = zlib.compress(data, 1)
+        if len(packed) < len(data):
+            return FLAG_ZLIB, packed
+    return 0, data
+
+
+def loads(flags, data):
+    if flags & FLAG_ZLIB:
+        data = zlib.decompress(data)
+    return pickle.loads(data)
+
+
+class SharedMemoryStore(object):
+    """ Direct-mapped, two-way hash table in a shared memory-mapped file.
+
+    The file holds ``slots`` slots of ``slot_size`` bytes; each key may live
+    in one of two slots chosen from its digest.  Values that do not fit in a
+    slot once serialized stay in the local cache only.  Writers serialize on
+    a thread lock striped over the slots, against the threads of their
+    process, and on a byte-range lock of the slot, against the other
+    processes; they bump the sequence counter of the slot around the write,
+    and readers take no lock and retry when the counter moved (seqlock).
+    """
+
+    def __init__(self, path_prefix, slots=4096, slot_size=8192):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - _HEADER.size
+        self.path = '%s-%dx%d.shm' % (path_prefix, slots, slot_size)
+        size = slots * slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            stat = os.fstat(fd)
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                # values are unpickled: never trust a file another user can write
+                raise PermissionError("%s is not private to the current user" % self.path)
+            if stat.st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._locks = [threading.Lock() for _index in range(LOCK_STRIPES)]
+
+    def _offsets(self, digest):
+        first = int.from_bytes(digest[:8], 'little') % self.slots
+        second = int.from_bytes(digest[8:], 'little') % self.slots
+        return first * self.slot_size, second * self.slot_size
+
+    def _read(self, offset, digest, stamp):
+        for _attempt in range(_READ_RETRIES):
+            seq, slot_digest, slot_stamp, length, flags = _HEADER.unpack_from(self._map, offset)
+            if seq & 1:
+                continue
+            if slot_digest != digest or slot_stamp != stamp or length > self.capacity:
+                return None
+            start = offset + _HEADER.size
+            data = self._map[start:start + length]
+            if _SEQ.unpack_from(self._map, offset)[0] == seq:
+                return flags, data
+        return None
+
+    def get(self, key, stamp):
+        """ Value of ``key`` stored under ``stamp``, or ``None``. """
+        digest = encode_key(key)
+        for offset in self._offsets(digest):
+            found = self._read(offset, digest, stamp)
+            if found is not None:
+                try:
+                    return loads(*found)
+                except Exception:
+                    _logger.debug("Discarding undecodable entry in %s", self.path, exc_info=True)
+                    return None
+        return None
+
+    def set(self, key, value, stamp):
+        """ Publish ``value`` for ``key`` under ``stamp``; return whether it
+            fitted in a slot.
+        """
+        flags, data = dumps(value)
+        if len(data) > self.capacity:
+            return False
+        digest = encode_key(key)
+        offset = self._choose(digest, stamp)
+        with self._locks[offset // self.slot_size % LOCK_STRIPES]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset, os.SEEK_SET)
+            try:
+                seq = _SEQ.unpack_from(self._map, offset)[0] | 1
+                _SEQ.pack_into(self._map, offset, seq)
+                start = offset + _HEADER.size
+                self._map[start:start + len(data)] = data
+                _FIELDS.pack_into(self._map, offset + _SEQ.size, digest, stamp, len(data), flags)
+                _SEQ.pack_into(self._map, offset, seq + 1)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset, os.SEEK_SET)
+        return True
+
+    def _choose(self, digest, stamp):
+        """ Slot offset to write ``digest`` to: the slot already holding it,
+            else one holding an entry of another stamp, else the first one.
+        """
+        offsets = self._offsets(digest)
+        fallback = None
+        for offset in offsets:
+            _seq, slot_digest, slot_stamp, _length, _flags = _HEADER.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                return offset
+            if fallback is None and slot_stamp != stamp:
+                fallback = offset
+        return offsets[0] if fallback is None else fallback
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+register_store('shm', SharedMemoryStore)
+
+
+def default_directory():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def store_path_prefix(directory, dbname, namespace):
+    """ File name prefix of the store of ``namespace`` on ``dbname``. """
+    name = re.sub(r'[^\w.-]', '_', 'view_record_cache-%s-%s' % (dbname, namespace))
+    return os.path.join(directory or default_directory(), name)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of concurrent computations of the same cache entry.
+
+When many requests of one process miss the same key at once (typically the
+pages of a website right after a restart or an invalidation), the first one
+computes the value and the others wait for it instead of running the same
+queries.  Waiters only take the value when it was computed under the same
+tag (cache generation and stamp) as their own transaction would use, and
+compute it themselves when the leader fails or takes longer than the
+timeout.
+"""
+
+import threading
+
+
+class Flight(object):
+    """ One computation in progress. """
+    __slots__ = ('tag', 'event', 'value', 'done')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.event = threading.Event()
+        self.value = None
+        self.done = False
+
+
+class SingleFlight(object):
+    """ Registry of the computations in progress, by key. """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def run(self, key, tag, compute, timeout=None):
+        """ Return ``(value, coalesced)``: the result of ``compute()``, or of
+            the concurrent computation of ``key`` under ``tag``, in which case
+            ``coalesced`` is true.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight(tag)
+        if not leader:
+            if flight.tag == tag and flight.event.wait(timeout) and flight.done:
+                return flight.value, True
+            return compute(), False
+        try:
+            flight.value = compute()
+            flight.done = True
+            return flight.value, False
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the view_record_cache module.
+
+Creates a throwaway database with view_record_cache installed, seeds it with
+qweb views organized in deep inheritance chains, then replays a mix of
+``search``, ``search_read``, ``read`` and ``read_combined`` calls on
+``ir.ui.view`` in three modes:
+
+``cold``
+    the caches are emptied before every call, which measures the cost of a
+    miss (key building, lookups and storing included);
+``warm``
+    the mix is played once to fill the caches, then measured;
+``write``
+    like ``warm``, but a view is written and committed every
+    ``--write-every`` calls, so the calls also pay for the invalidation.
+
+For every mode and method it reports latency percentiles, the number of SQL
+queries per call and the memory held by the caches.  Every call runs in its
+own transaction, like a request.
+
+Usage, with Odoo importable and a PostgreSQL the configuration file points
+to::
+
+    python3 view_record_cache/scripts/benchmark.py -c odoo.conf \\
+        --addons-path=addons,/path/to/this/repo --views 3000 --depth 8
+
+The database is dropped at the end unless ``--keep`` is given; an existing
+database can be reused with ``--reuse`` (it is then neither seeded again nor
+dropped).  ``--json FILE`` writes the results for comparison between runs,
+and ``--mix FILE`` replays calls recorded as a JSON list of
+``[method, arguments, context]`` instead of the generated mix.
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger('view_record_cache.benchmark')
+
+MODES = ('cold', 'warm', 'write')
+READ_FIELDS = ['name', 'key', 'type', 'priority', 'inherit_id', 'mode', 'active']
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark of view_record_cache")
+    parser.add_argument('-c', '--config', help="Odoo configuration file")
+    parser.add_argument('--addons-path', help="Odoo addons path")
+    parser.add_argument('-d', '--database', default='view_record_cache_bench',
+                        help="throwaway database (default: %(default)s)")
+    parser.add_argument('--views', type=int, default=3000,
+                        help="number of views to create (default: %(default)s)")
+    parser.add_argument('--depth', type=int, default=8,
+                        help="length of the inheritance chains (default: %(default)s)")
+    parser.add_argument('--calls', type=int, default=2000,
+                        help="calls per mode (default: %(default)s)")
+    parser.add_argument('--write-every', type=int, default=50,
+                        help="calls between two writes in write mode (default: %(default)s)")
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help="comma-separated modes to run (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed")
+    parser.add_argument('--mix', help="JSON file of recorded calls to replay")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--reuse', action='store_true', help="reuse an existing database")
+    parser.add_argument('--keep', action='store_true', help="do not drop the database")
+    return parser.parse_args(argv)
+
+
+def setup_odoo(args):
+    odoo_args = ['--stop-after-init', '--log-level=warn', '-d', args.database]
+    if args.config:
+        odoo_args += ['-c', args.config]
+    if args.addons_path:
+        odoo_args += ['--addons-path', args.addons_path]
+    odoo.tools.config.parse_config(odoo_args)
+    # warm-up and snapshots would skew the cold numbers
+    odoo.tools.config['view_record_cache_warmup'] = False
+    odoo.tools.config['view_record_cache_snapshot'] = False
+    odoo.tools.config['view_record_cache_stats_interval'] = 10 ** 9
+
+
+def create_database(args):
+    if args.reuse:
+        return odoo.registry(args.database)
+    odoo.service.db._create_empty_database(args.database)
+    odoo.tools.config['init'] = {'view_record_cache': 1}
+    try:
+        return odoo.modules.registry.Registry.new(args.database, update_module=True)
+    finally:
+        odoo.tools.config['init'] = {}
+
+
+def seed_views(registry, count, depth):
+    """ Create ``count`` qweb views: roots each followed by a chain of
+        ``depth`` views inheriting from the previous one.
+    """
+    with api.Environment.manage(), registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        View = env['ir.ui.view']
+        created = 0
+        root_index = 0
+        while created < count:
+            root = View.create({
+                'name': 'bench.root_%d' % root_index,
+                'key': 'bench.root_%d' % root_index,
+                'type': 'qweb',
+                'arch': '<t t-name="bench.root_%d"><div class="root"><span>%d</span></div></t>'
+                        % (root_index, root_index),
+            })
+            created += 1
+            parent = root
+            for level in range(min(depth, count - created)):
+                parent = View.create({
+                    'name': 'bench.root_%d_%d' % (root_index, level),
+                    'key': 'bench.root_%d_%d' % (root_index, level),
+                    'type': 'qweb',
+                    'mode': 'extension',
+                    'inherit_id': parent.id,
+                    'priority': 16 + level,
+                    'arch': '<xpath expr="//div[hasclass(\'root\')]" position="inside">'
+                            '<p class="level_%d">%d</p></xpath>' % (level, level),
+                })
+                created += 1
+            root_index += 1
+        _logger.warning("Seeded %d views in %d trees", created, root_index)
+
+
+def generate_mix(registry, args):
+    """ Return ``args.calls`` calls ``(method, arguments, context)`` whose
+        targets follow a skewed popularity, like page views do.
+    """
+    with api.Environment.manage(), registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        roots = env['ir.ui.view'].search(
+            [('key', '=like', 'bench.root_%'), ('mode', '=', 'primary')], order='id').ids
+        # trees were created one after the other: a root is followed by its chain
+        all_ids = env['ir.ui.view'].search([('key', '=like', 'bench.%')], order='id').ids
+    rng = random.Random(args.seed)
+
+    def popular(items):
+        return items[min(int(rng.paretovariate(1.2)) - 1, len(items) - 1)]
+
+    calls = []
+    for _index in range(args.calls):
+        kind = rng.random()
+        root = popular(roots)
+        if kind < 0.35:
+            calls.append(('search', ([('inherit_id', '=', root)], 0, None, 'priority,id', False), {}))
+        elif kind < 0.45:
+            calls.append(('search', ([('type', '=', 'qweb'), ('key', '=like', 'bench.%')], 0, 80, None, False), {}))
+        elif kind < 0.60:
+            calls.append(('search_read', ([('id', '=', root)], ['key', 'arch_db'], 0, None, None),
+                          {'website_id': 1}))
+        elif kind < 0.85:
+            start = all_ids.index(root)
+            ids = all_ids[start:start + rng.randint(1, args.depth + 1)]
+            calls.append(('read', (ids, READ_FIELDS), {}))
+        else:
+            calls.append(('read_combined', ([root], ['arch']), {}))
+    return calls
+
+
+def load_mix(path):
+    with open(path) as file:
+        return [(method, tuple(arguments), context or {}) for method, arguments, context in json.load(file)]
+
+
+def call(env, method, arguments, context):
+    View = env['ir.ui.view'].with_context(context)
+    if method in ('read', 'read_combined'):
+        ids, arguments = arguments[0], arguments[1:]
+        return getattr(View.browse(ids), method)(*arguments)
+    return getattr(View, method)(*arguments)
+
+
+def cache_usage(dbname):
+    from odoo.addons.view_record_cache.models.record_cache_mixin import _iter_record_caches
+    usage = {}
+    for model, method, partition, cache in _iter_record_caches(dbname):
+        usage['%s %s %s' % (model, method, partition)] = {'entries': len(cache), 'bytes': cache.bytes}
+    return usage
+
+
+def clear_caches(dbname):
+    from odoo.addons.view_record_cache.models.record_cache_mixin import clear_record_caches
+    clear_record_caches(dbname, 'ir.ui.view')
+
+
+def write_view(registry, rng, uid):
+    with registry.cursor() as cr:
+        env = api.Environment(cr, uid, {})
+        views = env['ir.ui.view'].search([('key', '=like', 'bench.%')], limit=200)
+        view = views[rng.randrange(len(views))]
+        view.write({'priority': view.priority % 64 + 1})
+
+
+def run_mode(registry, mode, calls, args):
+    """ Play ``calls`` in ``mode``; return ``{method: [(seconds, queries)]}``. """
+    dbname = registry.db_name
+    rng = random.Random(args.seed)
+    with registry.cursor() as cr:
+        uid = api.Environment(cr, SUPERUSER_ID, {}).ref('base.user_admin').id
+    clear_caches(dbname)
+    if mode != 'cold':
+        for method, arguments, context in calls:
+            with registry.cursor() as cr:
+                call(api.Environment(cr, uid, {}), method, arguments, context)
+    samples = defaultdict(list)
+    for index, (method, arguments, context) in enumerate(calls):
+        if mode == 'cold':
+            clear_caches(dbname)
+        elif mode == 'write' and index % args.write_every == 0:
+            write_view(registry, rng, uid)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, {})
+            queries = cr.sql_log_count
+            start = time.perf_counter()
+            call(env, method, arguments, context)
+            elapsed = time.perf_counter() - start
+            samples[method].append((elapsed, cr.sql_log_count - queries))
+    return samples
+
+
+def percentile(values, rank):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(rank / 100.0 * (len(values) - 1))))]
+
+
+def summarize(samples):
+    result = {}
+    for method, items in sorted(samples.items()):
+        times = [elapsed * 1000.0 for elapsed, _queries in items]
+        result[method] = {
+            'calls': len(items),
+            'p50_ms': percentile(times, 50),
+            'p90_ms': percentile(times, 90),
+            'p99_ms': percentile(times, 99),
+            'max_ms': max(times),
+            'queries_per_call': sum(queries for _elapsed, queries in items) / float(len(items)),
+        }
+    return result
+
+
+def print_report(results):
+    line = '%-6s %-14s %7s %9s %9s %9s %9s %9s'
+    print(line % ('mode', 'method', 'calls', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'queries'))
+    for mode, result in results.items():
+        for method, values in result['methods'].items():
+            print('%-6s %-14s %7d %9.3f %9.3f %9.3f %9.3f %9.2f' % (
+                mode, method, values['calls'], values['p50_ms'], values['p90_ms'],
+                values['p99_ms'], values['max_ms'], values['queries_per_call']))
+        for name, usage in sorted(result['caches'].items()):
+            print('%-6s cache %-24s %7d entries %12d bytes' % (mode, name, usage['entries'], usage['bytes']))
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    setup_odoo(args)
+    registry = create_database(args)
+    try:
+        if not args.reuse:
+            seed_views(registry, args.views, args.depth)
+        with api.Environment.manage():
+            calls = load_mix(args.mix) if args.mix else generate_mix(registry, args)
+            results = {}
+            for mode in args.modes.split(','):
+                samples = run_mode(registry, mode, calls, args)
+                results[mode] = {
+                    'methods': summarize(samples),
+                    'caches': cache_usage(registry.db_name),
+                }
+        print_report(results)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump({'arguments': vars(args), 'results': results}, file, indent=2, sort_keys=True)
+    finally:
+        if not args.reuse and not args.keep:
+            odoo.service.db.exp_drop(args.database)
+
+
+if __name__ == '__main__':
+    main()
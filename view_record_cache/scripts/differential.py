@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Differential check of the view_record_cache module against the ORM.
+
+Seeds a database like ``benchmark.py`` does, creates users with random group
+sets, then generates random calls on ``ir.ui.view`` (domains, field lists,
+offsets, limits, orders, users, active_test and websites) and plays each of
+them twice in the same transaction: with every cache of the module disabled
+(``record_cache_disabled`` in the context, down to the ``read`` and
+``search`` calls the ORM makes itself), then through the cached methods,
+with the ORM cache emptied in between.  Results, or the exceptions raised, must be equal.
+
+Two scenarios are run:
+
+``sequential``
+    one thread plays the calls, writing, creating or unlinking a view every
+    ``--write-every`` calls;
+``concurrent``
+    ``--threads`` threads play the calls while another one keeps changing
+    views, so that invalidations race with lookups.
+
+Every run reports the mismatches and the time spent in both paths per
+method, i.e. the speed-up of the caches on that workload.  The exit status
+is 1 when a mismatch was found.
+
+Usage, with Odoo importable and a PostgreSQL the configuration file points
+to::
+
+    python3 view_record_cache/scripts/differential.py -c odoo.conf \\
+        --addons-path=addons,/path/to/this/repo --calls 5000 --seed 7
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+# the seeding helpers live next to this script, whatever the working
+# directory or the way it is started
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark import READ_FIELDS, create_database, seed_views, setup_odoo
+
+_logger = logging.getLogger('view_record_cache.differential')
+
+SCENARIOS = ('sequential', 'concurrent')
+METHODS = ('search', 'search_count', 'search_read', 'read', 'read_combined')
+
+# orders ending with id, so that both paths sort ties the same way
+ORDERS = (None, 'id', 'id desc', 'priority,id', 'name,id', 'key desc,id', 'inherit_id,priority desc,id')
+
+# groups drawn for the users, on top of base.group_user
+EXTRA_GROUPS = ('base.group_system', 'base.group_erp_manager', 'base.group_no_one',
+                'base.group_partner_manager', 'base.group_multi_company')
+
+USER_LOGIN = 'view_record_cache_diff_%d'
+MAX_REPORTED = 20
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Differential check of view_record_cache")
+    parser.add_argument('-c', '--config', help="Odoo configuration file")
+    parser.add_argument('--addons-path', help="Odoo addons path")
+    parser.add_argument('-d', '--database', default='view_record_cache_diff',
+                        help="throwaway database (default: %(default)s)")
+    parser.add_argument('--views', type=int, default=1000,
+                        help="number of views to create (default: %(default)s)")
+    parser.add_argument('--depth', type=int, default=6,
+                        help="length of the inheritance chains (default: %(default)s)")
+    parser.add_argument('--users', type=int, default=8,
+                        help="users with random group sets (default: %(default)s)")
+    parser.add_argument('--calls', type=int, default=2000,
+                        help="calls per scenario (default: %(default)s)")
+    parser.add_argument('--write-every', type=int, default=25,
+                        help="calls between two changes in sequential mode (default: %(default)s)")
+    parser.add_argument('--threads', type=int, default=4,
+                        help="reading threads in concurrent mode (default: %(default)s)")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help="comma-separated scenarios to run (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--reuse', action='store_true', help="reuse an existing database")
+    parser.add_argument('--keep', action='store_true', help="do not drop the database")
+    return parser.parse_args(argv)
+
+
+def create_users(registry, count, rng):
+    """ Return the ids of ``count`` users with random group sets, and of the
+        superuser.
+    """
+    with api.Environment.manage(), registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        groups = [env.ref(xmlid, raise_if_not_found=False) for xmlid in EXTRA_GROUPS]
+        groups = [group for group in groups if group]
+        uids = [SUPERUSER_ID]
+        for index in range(count):
+            login = USER_LOGIN % index
+            user = env['res.users'].with_context(active_test=False).search([('login', '=', login)])
+            if not user:
+                picked = rng.sample(groups, rng.randint(0, len(groups)))
+                user = env['res.users'].create({
+                    'name': login,
+                    'login': login,
+                    'groups_id': [(6, 0, [env.ref('base.group_user').id] + [group.id for group in picked])],
+                })
+            uids.append(user.id)
+        return uids
+
+
+class CallGenerator(object):
+    """ Random calls ``(method, arguments, context, uid)`` on the seeded
+        views.
+    """
+
+    def __init__(self, registry, uids, rng):
+        self.rng = rng
+        self.uids = uids
+        with api.Environment.manage(), registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            View = env['ir.ui.view'].with_context(active_test=False)
+            self.roots = View.search([('key', '=like', 'bench.root_%'), ('mode', '=', 'primary')]).ids
+            self.ids = View.search([('key', '=like', 'bench.%')]).ids
+            self.websites = env['website'].search([]).ids if 'website' in env else []
+            self.has_website_id = 'website_id' in View._fields
+
+    def leaf(self):
+        rng = self.rng
+        kind = rng.randrange(12)
+        if kind == 0:
+            return ('type', '=', rng.choice(['qweb', 'form', 'tree']))
+        if kind == 1:
+            return ('mode', '=', rng.choice(['primary', 'extension']))
+        if kind == 2:
+            return ('active', '=', rng.random() < 0.8)
+        if kind == 3:
+            return ('priority', rng.choice(['>', '<=', '=']), rng.randint(10, 30))
+        if kind == 4:
+            return ('inherit_id', '=', rng.choice(self.roots + [False]))
+        if kind == 5:
+            return ('inherit_id', 'in', rng.sample(self.ids, min(len(self.ids), rng.randint(1, 10))))
+        if kind == 6:
+            return ('key', '=like', 'bench.root_%d%%' % rng.randrange(len(self.roots)))
+        if kind == 7:
+            return ('name', rng.choice(['ilike', 'not ilike']), 'root_%d' % rng.randrange(len(self.roots)))
+        if kind == 8:
+            return ('id', rng.choice(['in', 'not in']), rng.sample(self.ids, min(len(self.ids), 20)))
+        if kind == 9:
+            return ('inherit_id.key', '=like', 'bench.root_%d%%' % rng.randrange(len(self.roots)))
+        if kind == 10:
+            return ('inherit_id', 'child_of', rng.choice(self.roots))
+        if self.has_website_id:
+            return ('website_id', 'in', [False] + self.websites[:1])
+        return ('key', '!=', False)
+
+    def domain(self):
+        rng = self.rng
+        domain = [self.leaf()]
+        for _index in range(rng.randint(0, 2)):
+            domain = [rng.choice(['&', '|'])] + domain + [self.leaf()]
+        if rng.random() < 0.1:
+            domain = ['!'] + domain
+        return domain
+
+    def fields(self):
+        rng = self.rng
+        if rng.random() < 0.1:
+            return []
+        return rng.sample(READ_FIELDS, rng.randint(1, len(READ_FIELDS)))
+
+    def context(self):
+        rng = self.rng
+        context = {'lang': 'en_US'}
+        if rng.random() < 0.2:
+            context['active_test'] = False
+        if self.websites and rng.random() < 0.5:
+            context['website_id'] = rng.choice(self.websites)
+        return context
+
+    def call(self):
+        rng = self.rng
+        method = rng.choice(METHODS)
+        offset = rng.choice([0, 0, 0, rng.randint(1, 50)])
+        limit = rng.choice([None, None, 10, 80])
+        order = rng.choice(ORDERS)
+        if method == 'search':
+            arguments = (self.domain(), offset, limit, order)
+        elif method == 'search_count':
+            arguments = (self.domain(), offset, limit)
+        elif method == 'search_read':
+            arguments = (self.domain(), self.fields(), offset, limit, order)
+        elif method == 'read':
+            start = rng.randrange(len(self.ids))
+            arguments = (self.ids[start:start + rng.randint(1, 12)], self.fields())
+        else:
+            arguments = ([rng.choice(self.roots)], rng.choice([None, ['arch'], ['arch', 'name']]))
+        return (method, arguments, self.context(), rng.choice(self.uids))
+
+
+def _cached_paths():
+    cached = {
+        'search': lambda View, domain, offset, limit, order:
+            View.search(domain, offset=offset, limit=limit, order=order).ids,
+        'search_count': lambda View, domain, offset, limit:
+            View.search(domain, offset=offset, limit=limit, count=True),
+        'search_read': lambda View, domain, fields, offset, limit, order:
+            View.search_read(domain, fields, offset=offset, limit=limit, order=order),
+        'read': lambda View, ids, fields: View.browse(ids).read(fields),
+        'read_combined': lambda View, ids, fields: View.browse(ids).read_combined(fields),
+    }
+
+    def uncached(func):
+        # read_combined itself calls read and search: none of them may hit
+        return lambda View, *arguments: func(View.with_context(record_cache_disabled=True), *arguments)
+
+    reference = {method: uncached(func) for method, func in cached.items()}
+    return reference, cached
+
+
+def timed(cr, func, *arguments):
+    """ Return ``(outcome, seconds)``, ``outcome`` being ``('ok', result)``
+        or ``('error', exception class name)``.
+    """
+    start = time.perf_counter()
+    try:
+        with cr.savepoint():
+            outcome = ('ok', func(*arguments))
+    except Exception as exc:
+        outcome = ('error', type(exc).__name__)
+    return outcome, time.perf_counter() - start
+
+
+class Results(object):
+    """ Counters and mismatches of a scenario, shared by its threads. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = defaultdict(lambda: {'calls': 0, 'mismatches': 0, 'errors': 0,
+                                            'orm_time': 0.0, 'cached_time': 0.0})
+        self.mismatches = []
+
+    def add(self, call, expected, actual, orm_time, cached_time):
+        method = call[0]
+        with self.lock:
+            values = self.methods[method]
+            values['calls'] += 1
+            values['orm_time'] += orm_time
+            values['cached_time'] += cached_time
+            if expected[0] == 'error':
+                values['errors'] += 1
+            if expected != actual:
+                values['mismatches'] += 1
+                if len(self.mismatches) < MAX_REPORTED:
+                    self.mismatches.append({
+                        'method': method,
+                        'arguments': repr(call[1]),
+                        'context': call[2],
+                        'uid': call[3],
+                        'expected': repr(expected)[:500],
+                        'actual': repr(actual)[:500],
+                    })
+
+    def summary(self):
+        result = {}
+        for method, values in sorted(self.methods.items()):
+            values = dict(values)
+            values['speedup'] = values['orm_time'] / values['cached_time'] if values['cached_time'] else 0.0
+            result[method] = values
+        return {'methods': result, 'mismatches': self.mismatches}
+
+
+def check_call(registry, paths, call, results):
+    """ Play ``call`` through both paths in one transaction and compare. """
+    reference, cached = paths
+    method, arguments, context, uid = call
+    with registry.cursor() as cr:
+        env = api.Environment(cr, uid, context)
+        View = env['ir.ui.view']
+        expected, orm_time = timed(cr, reference[method], View, *arguments)
+        # the cached path must not find the records loaded by the ORM path
+        env.invalidate_all()
+        actual, cached_time = timed(cr, cached[method], View, *arguments)
+    results.add(call, expected, actual, orm_time, cached_time)
+
+
+def change_views(registry, rng):
+    """ Commit a random change to the seeded views: a write, a new extension
+        view or the removal of one.
+    """
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        View = env['ir.ui.view'].with_context(active_test=False)
+        roots = View.search([('key', '=like', 'bench.root_%'), ('mode', '=', 'primary')])
+        views = View.search([('key', '=like', 'bench.%')])
+        view = views[rng.randrange(len(views))]
+        kind = rng.random()
+        if kind < 0.25:
+            view.write({'priority': rng.randint(1, 64)})
+        elif kind < 0.4:
+            view.write({'name': '%s_%d' % (view.key, rng.randrange(1000))})
+        elif kind < 0.55 and view.mode == 'extension':
+            view.write({'active': not view.active})
+        elif kind < 0.7 and view.mode == 'extension':
+            view.write({'inherit_id': roots[rng.randrange(len(roots))].id})
+        elif kind < 0.9:
+            index = rng.randrange(10 ** 9)
+            View.create({
+                'name': 'bench.extra_%d' % index,
+                'key': 'bench.extra_%d' % index,
+                'type': 'qweb',
+                'mode': 'extension',
+                'inherit_id': roots[rng.randrange(len(roots))].id,
+                'arch': '<xpath expr="//div[hasclass(\'root\')]" position="inside">'
+                        '<i class="extra">%d</i></xpath>' % index,
+            })
+        else:
+            extras = View.search([('key', '=like', 'bench.extra_%')])
+            if extras:
+                extras[rng.randrange(len(extras))].unlink()
+
+
+def run_sequential(registry, paths, calls, args):
+    results = Results()
+    rng = random.Random(args.seed)
+    for index, call in enumerate(calls):
+        if args.write_every and index and index % args.write_every == 0:
+            change_views(registry, rng)
+        check_call(registry, paths, call, results)
+    return results
+
+
+def run_concurrent(registry, paths, calls, args):
+    results = Results()
+    done = threading.Event()
+    errors = []
+
+    def read(chunk):
+        try:
+            with api.Environment.manage():
+                for call in chunk:
+                    check_call(registry, paths, call, results)
+        except Exception as exc:
+            errors.append(exc)
+            _logger.exception("Reading thread failed")
+
+    def write():
+        rng = random.Random(args.seed)
+        with api.Environment.manage():
+            while not done.is_set():
+                try:
+                    change_views(registry, rng)
+                except Exception:
+                    # concurrent updates of the same view may conflict
+                    _logger.debug("Change failed", exc_info=True)
+
+    count = max(args.threads, 1)
+    readers = [threading.Thread(target=read, args=(calls[index::count],)) for index in range(count)]
+    writer = threading.Thread(target=write)
+    writer.start()
+    for thread in readers:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    done.set()
+    writer.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def print_report(results):
+    line = '%-10s %-13s %7s %10s %7s %10s %10s %8s'
+    print(line % ('scenario', 'method', 'calls', 'mismatches', 'errors', 'orm ms', 'cached ms', 'speed-up'))
+    for scenario, result in results.items():
+        for method, values in result['methods'].items():
+            print('%-10s %-13s %7d %10d %7d %10.1f %10.1f %7.1fx' % (
+                scenario, method, values['calls'], values['mismatches'], values['errors'],
+                values['orm_time'] * 1000.0, values['cached_time'] * 1000.0, values['speedup']))
+        for mismatch in result['mismatches']:
+            print('%-10s MISMATCH %s uid=%s context=%s %s' % (
+                scenario, mismatch['method'], mismatch['uid'], mismatch['context'], mismatch['arguments']))
+            print('    orm:    %s' % mismatch['expected'])
+            print('    cached: %s' % mismatch['actual'])
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    setup_odoo(args)
+    registry = create_database(args)
+    found = False
+    try:
+        if not args.reuse:
+            seed_views(registry, args.views, args.depth)
+        rng = random.Random(args.seed)
+        with api.Environment.manage():
+            uids = create_users(registry, args.users, rng)
+            generator = CallGenerator(registry, uids, rng)
+            paths = _cached_paths()
+            results = {}
+            for scenario in args.scenarios.split(','):
+                calls = [generator.call() for _index in range(args.calls)]
+                run = run_concurrent if scenario == 'concurrent' else run_sequential
+                results[scenario] = run(registry, paths, calls, args).summary()
+                found = found or bool(results[scenario]['mismatches'])
+        print_report(results)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump({'arguments': vars(args), 'results': results}, file, indent=2, sort_keys=True,
+                          default=repr)
+    finally:
+        if not args.reuse and not args.keep:
+            odoo.service.db.exp_drop(args.database)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
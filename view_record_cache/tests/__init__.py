@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+from . import test_cache_key
+from . import test_cache_signaling
+from . import test_compact_rows
+from . import test_domain_match
+from . import test_read_cache
+from . import test_record_cache
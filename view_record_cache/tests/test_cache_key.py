@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import common
+
+from ..models.cache_key import freeze, normalize_domain, thaw_domain
+
+
+class TestCacheKey(common.BaseCase):
+
+    def test_false_is_not_zero(self):
+        # "IS NULL" and "= 0" are different searches
+        null_key = normalize_domain([('inherit_id', '=', False)])
+        zero_key = normalize_domain([('inherit_id', '=', 0)])
+        self.assertNotEqual(null_key, zero_key)
+        self.assertNotEqual(hash(null_key), hash(zero_key))
+        self.assertNotEqual(normalize_domain([('active', '=', True)]),
+                            normalize_domain([('active', '=', 1)]))
+        self.assertNotEqual(normalize_domain([('key', '=', None)]),
+                            normalize_domain([('key', '=', False)]))
+
+    def test_in_values_are_not_merged(self):
+        self.assertNotEqual(normalize_domain([('inherit_id', 'in', [False, 0])]),
+                            normalize_domain([('inherit_id', 'in', [0])]))
+        self.assertNotEqual(normalize_domain([('priority', 'in', [True, 1])]),
+                            normalize_domain([('priority', 'in', [1])]))
+
+    def test_equivalent_spellings(self):
+        self.assertEqual(normalize_domain([('id', 'in', [3, 1, 3])]),
+                         normalize_domain([('id', 'in', (1, 3))]))
+        self.assertEqual(normalize_domain(['&', ('type', '=', 'qweb'), ('mode', '<>', 'primary')]),
+                         normalize_domain([('mode', '!=', 'primary'), ('type', '=', 'qweb')]))
+
+    def test_thaw_domain(self):
+        domain = ['|', ('inherit_id', '=', False), ('id', 'in', [0, 2, False]),
+                  ('key', '=', None), ('name', 'in', ['bool', True])]
+        self.assertEqual(thaw_domain(normalize_domain(domain)), [
+            '|', ('inherit_id', '=', False), ('id', 'in', [False, 0, 2]),
+            ('key', '=', None), ('name', 'in', ['bool', True]),
+        ])
+        self.assertEqual(freeze(['bool', True]), ('bool', ('bool', True)))
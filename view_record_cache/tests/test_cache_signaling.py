@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import common
+
+from ..models.cache_signaling import entry_stamp, partition_stamp_key, split_stamp_key
+
+
+class TestCacheSignaling(common.BaseCase):
+
+    def test_partition_flush_keeps_other_partitions(self):
+        stamps = {'ir.ui.view': 10}
+        before = {partition: entry_stamp(stamps, 'ir.ui.view', partition)
+                  for partition in ('backend', 'website_1', 'website_2')}
+        stamps[partition_stamp_key('ir.ui.view', 'website_1')] = 11
+        self.assertNotEqual(entry_stamp(stamps, 'ir.ui.view', 'website_1'), before['website_1'])
+        self.assertEqual(entry_stamp(stamps, 'ir.ui.view', 'website_2'), before['website_2'])
+        self.assertEqual(entry_stamp(stamps, 'ir.ui.view', 'backend'), before['backend'])
+
+    def test_model_change_reaches_every_partition(self):
+        stamps = {'ir.ui.view': 10, partition_stamp_key('ir.ui.view', 'website_1'): 11}
+        before = {partition: entry_stamp(stamps, 'ir.ui.view', partition)
+                  for partition in ('backend', 'website_1')}
+        stamps['ir.ui.view'] = 12
+        for partition, stamp in before.items():
+            self.assertNotEqual(entry_stamp(stamps, 'ir.ui.view', partition), stamp)
+
+    def test_split_stamp_key(self):
+        self.assertEqual(split_stamp_key('ir.ui.view'), ('ir.ui.view', None))
+        self.assertEqual(split_stamp_key(partition_stamp_key('ir.ui.view', 'website_1')),
+                         ('ir.ui.view', 'website_1'))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from odoo.tests import common
+
+from ..models import compact_rows
+from ..models.compact_rows import RecordValues, Rows
+
+
+class TestCompactRows(common.BaseCase):
+
+    def test_results_do_not_share_cached_lists(self):
+        rows = Rows.from_dicts([{'id': 1, 'groups_id': [3, 4], 'inherit_id': (2, 'Parent')}])
+        result = rows.to_dicts()
+        result[0]['groups_id'].append(5)
+        self.assertEqual(rows.to_dicts()[0]['groups_id'], [3, 4])
+
+        record = RecordValues(('groups_id',), ([3, 4],), ((3, 4),))
+        values = record.to_dict(['groups_id'])
+        values['groups_id'].append(5)
+        self.assertEqual(record.to_dict(['groups_id']), {'groups_id': [3, 4]})
+
+    def test_schemas_are_bounded(self):
+        with patch.object(compact_rows, 'MAX_SCHEMAS', 4):
+            records = [RecordValues(('field_%d' % index,), (index,), (index,)) for index in range(10)]
+            self.assertLessEqual(len(compact_rows._schemas), 4)
+            # entries interned before the tables started over still work
+            for index, record in enumerate(records):
+                self.assertIn('field_%d' % index, record)
+                self.assertEqual(record.to_dict(['field_%d' % index]), {'field_%d' % index: index})
+            self.assertLessEqual(len(compact_rows._positions), 4)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from odoo.osv import expression
+from odoo.tests import common
+
+from ..models.domain_match import _evaluate, may_match
+
+
+class TestDomainMatch(common.TransactionCase):
+    """ :func:`may_match` must never say no when the ORM finds the record,
+        and must agree with it whenever it decides.
+    """
+
+    def setUp(self):
+        super(TestDomainMatch, self).setUp()
+        View = self.env['ir.ui.view']
+        self.parent = View.create({
+            'name': 'vrc_parent',
+            'key': 'vrc.parent',
+            'type': 'qweb',
+            'arch': '<t t-name="vrc.parent"><div/></t>',
+        })
+        self.child = View.create({
+            'name': 'vrc child 50%',
+            'type': 'qweb',
+            'inherit_id': self.parent.id,
+            'mode': 'extension',
+            'priority': 0,
+            'arch': '<xpath expr="//div" position="inside"><span/></xpath>',
+        })
+        self.other = View.create({
+            'name': 'VRC Öther',
+            'key': 'vrc.other',
+            'type': 'qweb',
+            'priority': 5,
+            'active': False,
+            'arch': '<t t-name="vrc.other"><p/></t>',
+        })
+        self.views = self.parent | self.child | self.other
+
+    def _domains(self):
+        parent_id = self.parent.id
+        return [
+            [('inherit_id', '=', False)],
+            [('inherit_id', '!=', False)],
+            [('inherit_id', '=', parent_id)],
+            [('inherit_id', '!=', parent_id)],
+            [('inherit_id', 'in', [False, parent_id])],
+            [('inherit_id', 'in', [0])],
+            [('priority', 'in', [0, 5])],
+            [('priority', 'in', [False])],
+            [('priority', 'in', [])],
+            [('priority', '=', 0)],
+            [('priority', '!=', 0)],
+            [('priority', '=', '5')],
+            [('priority', '<', 10)],
+            [('priority', '>=', 16)],
+            [('key', '=', False)],
+            [('key', '!=', False)],
+            [('key', '!=', 'vrc.other')],
+            [('key', 'in', ['vrc.other', False])],
+            [('name', 'like', 'vrc%')],
+            [('name', 'like', '50%')],
+            [('name', 'like', '')],
+            [('key', 'like', '')],
+            ['!', ('key', 'like', '')],
+            [('name', 'ilike', 'vrc_')],
+            [('name', 'ilike', 'VRC_P')],
+            [('name', 'ilike', 'öther')],
+            [('name', '=like', 'vrc_parent')],
+            [('name', '=like', 'vrc\\_parent')],
+            [('name', '=ilike', 'VRC%')],
+            [('name', 'not like', 'other')],
+            [('active', '=', False)],
+            [('active', '!=', True)],
+            [('active', 'in', [True])],
+            [('mode', '=', 'extension')],
+            ['|', ('mode', '=', 'extension'), ('key', '=', 'vrc.other')],
+            ['!', ('inherit_id', '=', False)],
+            [('inherit_id.name', '=', 'vrc_parent')],
+            [('inherit_id', 'child_of', parent_id)],
+        ]
+
+    def test_matches_the_orm(self):
+        rows = {row['id']: row for row in self.views._record_cache_rows()}
+        View = self.env['ir.ui.view'].with_context(active_test=False)
+        for domain in self._domains():
+            found = set(View.search(domain + [('id', 'in', self.views.ids)]).ids)
+            for view_id, row in rows.items():
+                with self.subTest(domain=domain, view=view_id):
+                    if view_id in found:
+                        self.assertTrue(may_match(domain, row))
+                    result = _evaluate(expression.normalize_domain(domain), row)
+                    if result is not None:
+                        self.assertEqual(result, view_id in found)
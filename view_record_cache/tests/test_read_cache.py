@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import common
+
+
+class TestReadCache(common.TransactionCase):
+
+    def _cached_read_ids(self):
+        cache = self.env['ir.ui.view']._record_cache('read')
+        return {key[0] for key, _value, _meta, _created in cache.items()}
+
+    def test_parent_rename_drops_child_reads(self):
+        # no change yet in this transaction, so that reads are stored
+        child = self.env['ir.ui.view'].search([('inherit_id', '!=', False)], limit=1)
+        parent = child.inherit_id
+        child.read(['inherit_id'])
+        self.assertIn(child.id, self._cached_read_ids())
+
+        parent.write({'name': '%s renamed' % parent.name})
+        # the cached read of the child shows the old name of its parent
+        self.assertNotIn(child.id, self._cached_read_ids())
+        self.assertEqual(child.read(['inherit_id'])[0]['inherit_id'],
+                         (parent.id, parent.display_name))
+
+    def test_translation_drops_view_reads(self):
+        self.env['res.lang'].load_lang('fr_FR')
+        view = self.env['ir.ui.view'].search([('type', '=', 'qweb')], limit=1)
+        view.with_context(lang='fr_FR').read(['arch_db'])
+        self.assertIn(view.id, self._cached_read_ids())
+
+        self.env['ir.translation'].create({
+            'name': 'ir.ui.view,arch_db',
+            'type': 'model_terms',
+            'lang': 'fr_FR',
+            'res_id': view.id,
+            'src': 'Source',
+            'value': 'Traduction',
+            'state': 'translated',
+        })
+        # the cached arch is the one of the previous translations
+        self.assertNotIn(view.id, self._cached_read_ids())
+
+    def test_child_change_keeps_parent_reads(self):
+        child = self.env['ir.ui.view'].search([('inherit_id', '!=', False)], limit=1)
+        parent = child.inherit_id
+        parent.read(['name'])
+        self.assertIn(parent.id, self._cached_read_ids())
+
+        child.write({'priority': child.priority + 1})
+        # only the combined arch of the parent depends on its children
+        self.assertIn(parent.id, self._cached_read_ids())
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from odoo.tests import common
+
+from ..models.record_cache import FrequencySketch, LRUCache, ShardedLRUCache
+
+
+class TestLRUCache(common.BaseCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache('test', max_entries=2, admission=False)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        self.assertTrue(cache.set('c', 3))
+        self.assertEqual(sorted(key for key, _value, _meta, _created in cache.items()), ['a', 'c'])
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_byte_budget(self):
+        cache = LRUCache('test', max_bytes=100, admission=False)
+        cache.set('a', 'a', size=40)
+        cache.set('b', 'b', size=40)
+        cache.set('c', 'c', size=40)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.bytes, 80)
+        # larger than the whole budget
+        self.assertFalse(cache.set('d', 'd', size=101))
+        self.assertEqual(cache.stats.rejected, 1)
+
+    def test_admission(self):
+        cache = LRUCache('test', max_entries=1)
+        cache.set('hot', 1)
+        for _index in range(3):
+            cache.get('hot')
+        # a one-off key does not evict a popular one
+        self.assertFalse(cache.set('cold', 2))
+        self.assertIn('hot', cache)
+        for _index in range(5):
+            cache.get('cold')
+        self.assertTrue(cache.set('cold', 2))
+        self.assertNotIn('hot', cache)
+
+    def test_overwrite_is_admitted(self):
+        cache = LRUCache('test', max_bytes=100)
+        cache.set('hot', 'hot', size=50)
+        cache.set('refreshed', 1, size=40)
+        for _index in range(3):
+            cache.get('hot')
+        # a refresh replaces its own entry, even when it grew
+        self.assertTrue(cache.set('refreshed', 2, size=60))
+        self.assertEqual(cache.get('refreshed'), 2)
+        self.assertNotIn('hot', cache)
+        self.assertEqual(cache.bytes, 60)
+
+    def test_rejected_newcomer_keeps_entries(self):
+        cache = LRUCache('test', max_entries=2, max_bytes=100)
+        cache.set('a', 'a', size=40)
+        cache.set('b', 'b', size=40)
+        for _index in range(3):
+            cache.get('a')
+            cache.get('b')
+        self.assertFalse(cache.set('c', 'c', size=40))
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(cache.get('b'), 'b')
+        self.assertEqual(cache.bytes, 80)
+
+    def test_admission_tie(self):
+        cache = LRUCache('test', max_entries=1)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        # as popular as its victim: the newer key wins
+        self.assertTrue(cache.set('b', 2))
+        self.assertNotIn('a', cache)
+
+    def test_ttl(self):
+        cache = LRUCache('test', ttl=10, admission=False)
+        cache.set('old', 1, created=time.time() - 20)
+        cache.set('new', 2)
+        self.assertEqual(cache.lookup('old'), (1, None, True))
+        self.assertEqual(cache.lookup('new'), (2, None, False))
+        self.assertEqual(cache.lookup('missing'), (None, None, False))
+        self.assertEqual(cache.stats.stale_hits, 1)
+
+    def test_shed(self):
+        cache = LRUCache('test', admission=False)
+        for index in range(10):
+            cache.set(index, index, size=10)
+        self.assertEqual(cache.shed(0.25), 30)
+        self.assertNotIn(0, cache)
+        self.assertIn(3, cache)
+
+
+class TestShardedLRUCache(common.BaseCase):
+
+    def test_budget_split(self):
+        cache = ShardedLRUCache('test', shards=8, max_entries=80, max_bytes=8000, admission=False)
+        self.assertEqual(len(cache._shards), 8)
+        self.assertTrue(all(shard.max_entries == 10 for shard in cache._shards))
+        self.assertTrue(all(shard.max_bytes == 1000 for shard in cache._shards))
+
+    def test_value_larger_than_a_shard(self):
+        cache = ShardedLRUCache('test', shards=8, max_bytes=8000, admission=False)
+        for index in range(70):
+            cache.set(index, index, size=100)
+        # a view arch larger than the share of its shard fits the budget
+        self.assertTrue(cache.set('arch', 'arch', size=3000))
+        self.assertIn('arch', cache)
+        self.assertLessEqual(cache.bytes, 8000)
+        self.assertFalse(cache.set('huge', 'huge', size=8001))
+
+
+class TestFrequencySketch(common.BaseCase):
+
+    def test_counts_and_ages(self):
+        sketch = FrequencySketch(4)
+        for _index in range(5):
+            sketch.increment('a')
+        sketch.increment('b')
+        self.assertGreaterEqual(sketch.frequency('a'), 5)
+        self.assertGreaterEqual(sketch.frequency('b'), 1)
+        for _index in range(40):
+            sketch.increment('c')
+        # counters saturate, then are halved every 10 * capacity additions
+        self.assertLessEqual(sketch.frequency('c'), 15)
+        self.assertLess(sketch.frequency('a'), 5)